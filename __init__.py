@@ -12,5 +12,24 @@ caffa_dir = os.path.dirname(__file__)
 os.chdir(current_dir)
 
 from .restclient import RestClient, SessionType
-from .object import Object, create_class, create_method_class
+from .object import (
+    CompactObject,
+    Object,
+    ObjectBase,
+    create_class,
+    create_method_class,
+)
 from .method import Method
+from .fieldcache import FieldCache
+from .clientpool import ClientPool
+from .metrics import Metrics
+from .responsecache import ResponseCache
+from .sync import TreeSync
+from .transports import Http2Transport, TcpTransport, UnixSocketTransport
+from . import codec
+
+try:
+    from .asyncclient import AsyncRestClient
+except ImportError:
+    # aiohttp is an optional dependency, only needed for the asyncio client
+    pass
@@ -0,0 +1,116 @@
+###################################################################################################
+#
+#   Caffa
+#   Copyright (C) Kontur AS
+#
+#   GNU Lesser General Public License Usage
+#   This library is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation; either version 2.1 of the License, or
+#   (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful, but WITHOUT ANY
+#   WARRANTY; without even the implied warranty of MERCHANTABILITY or
+#   FITNESS FOR A PARTICULAR PURPOSE.
+#
+#   See the GNU Lesser General Public License at <<http:#www.gnu.org/licenses/lgpl-2.1.html>>
+#   for more details.
+#
+import json
+import warnings
+
+try:
+    import numpy
+except ImportError:
+    # NumPy is optional and only needed for array valued fields as NumPy arrays
+    numpy = None
+
+BINARY_CONTENT_TYPE = "application/octet-stream"
+
+# Ask for raw little-endian array data, but accept JSON from servers without it
+ACCEPT_ARRAY = BINARY_CONTENT_TYPE + ", application/json;q=0.9"
+
+# NumPy data types for JSON schema (type, format) pairs
+_DTYPES = {
+    ("integer", None): "<i8",
+    ("integer", "int32"): "<i4",
+    ("integer", "int64"): "<i8",
+    ("integer", "uint32"): "<u4",
+    ("integer", "uint64"): "<u8",
+    ("number", None): "<f8",
+    ("number", "float"): "<f4",
+    ("number", "double"): "<f8",
+    ("boolean", None): "?",
+}
+
+
+def require_numpy():
+    if numpy is None:
+        raise ImportError("NumPy is required for array valued fields as NumPy arrays")
+
+
+# The NumPy data type of a numeric array field schema, or None for other fields
+def array_dtype(field_schema):
+    if not isinstance(field_schema, dict) or field_schema.get("type") != "array":
+        return None
+    items = field_schema.get("items")
+    if not isinstance(items, dict):
+        return None
+    return _DTYPES.get((items.get("type"), items.get("format")))
+
+
+def is_array(value):
+    return numpy is not None and isinstance(value, numpy.ndarray)
+
+
+def to_json_value(value):
+    if is_array(value):
+        return value.tolist()
+    return value
+
+
+# Raw little-endian data of an array in the data type the field schema declares,
+# since the server reads binary arrays as that type whatever the caller used
+def to_binary(array, dtype):
+    return array.astype(numpy.dtype(dtype).newbyteorder("<"), copy=False).tobytes()
+
+
+def parse_json_array(text, dtype):
+    text = text.strip()
+    if not text.startswith("[") or not text.endswith("]"):
+        return numpy.asarray(json.loads(text), dtype=dtype)
+    content = text[1:-1]
+    if not content.strip():
+        return numpy.empty(0, dtype=dtype)
+
+    # Vectorized parse of a flat array of numbers. Anything numpy cannot parse
+    # completely (nested arrays, null, booleans) goes through the JSON parser.
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            array = numpy.fromstring(content, dtype=dtype, sep=",")
+        if len(array) == content.count(",") + 1:
+            return array
+    except (ValueError, DeprecationWarning):
+        pass
+    return numpy.asarray(json.loads(text), dtype=dtype)
+
+
+# Read a binary array response straight into a preallocated array
+def read_binary_array(response, dtype):
+    dtype = numpy.dtype(dtype)
+    length = response.headers.get("Content-Length")
+    if length is None or "Content-Encoding" in response.headers:
+        return numpy.frombuffer(bytearray(response.content), dtype=dtype)
+
+    array = numpy.empty(int(length) // dtype.itemsize, dtype=dtype)
+    buffer = memoryview(array).cast("B")
+    offset = 0
+    while offset < len(buffer):
+        size = response.raw.readinto(buffer[offset:])
+        if not size:
+            raise RuntimeError(
+                "Incomplete array data: got %d of %d bytes" % (offset, len(buffer))
+            )
+        offset += size
+    return array
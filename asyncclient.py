@@ -0,0 +1,412 @@
+###################################################################################################
+#
+#   Caffa
+#   Copyright (C) Kontur AS
+#
+#   GNU Lesser General Public License Usage
+#   This library is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation; either version 2.1 of the License, or
+#   (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful, but WITHOUT ANY
+#   WARRANTY; without even the implied warranty of MERCHANTABILITY or
+#   FITNESS FOR A PARTICULAR PURPOSE.
+#
+#   See the GNU Lesser General Public License at <<http:#www.gnu.org/licenses/lgpl-2.1.html>>
+#   for more details.
+#
+
+import aiohttp
+import asyncio
+import base64
+import contextlib
+import logging
+import time
+
+from . import arrays, codec, object
+from .restclient import (
+    MIN_APP_VERSION,
+    MAX_APP_VERSION,
+    RestClient,
+    SessionType,
+    compare_app_version,
+    full_schema_location,
+    json_text_to_object,
+    keepalive_interval,
+    merge_schema_properties,
+    object_schema_location,
+    schema_location_from_keyword,
+    schema_references,
+)
+
+
+# asyncio counterpart of RestClient. All network calls are coroutines and the
+# keepalives run as a task on the event loop instead of a separate thread.
+#
+#     async with AsyncRestClient("127.0.0.1") as client:
+#         doc = await client.document("testDocument")
+#         value = await (await doc.aget("demoObject")).aget("doubleField")
+#
+# Generated objects returned by this client are read and written with
+# Object.aget(), Object.aget_many(), Object.aset() and Object.aset_fields(), and
+# their methods are awaited. The blocking accessors raise TypeError for them.
+class AsyncRestClient:
+    pool_maxsize = 100
+
+    is_async = True
+
+    def __init__(
+            self,
+            hostname,
+            port=50000,
+            username="",
+            password="",
+            min_app_version=MIN_APP_VERSION,
+            max_app_version=MAX_APP_VERSION,
+            session_type=SessionType.REGULAR,
+            pool_maxsize=None,
+            preload_schemas=False,
+    ):
+        self.hostname = hostname
+        self.port = port
+        credentials = (username + ":" + password).encode("latin1")
+        self.auth_header = "Basic " + base64.b64encode(credentials).decode("ascii")
+        self.min_app_version = min_app_version
+        self.max_app_version = max_app_version
+        self.session_type = session_type
+        self.preload = preload_schemas
+        self._pool_maxsize = pool_maxsize or AsyncRestClient.pool_maxsize
+
+        self.log = logging.getLogger("rpc-logger")
+        self.session = None
+        self.session_uuid = None
+        self.keepalive_task = None
+        self.keepalive_interval = RestClient.default_keepalive_interval
+        self._last_request_time = time.monotonic()
+
+        self._schema_cache = {}
+        self._schema_properties_cache = {}
+        self._class_cache = {}
+        self._app_version = None
+        self._supports_object_get = None
+        self._supports_object_put = None
+        self.numpy_arrays = False
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.quit()
+
+    async def connect(self):
+        connector = aiohttp.TCPConnector(
+            limit=self._pool_maxsize, limit_per_host=self._pool_maxsize
+        )
+        self.session = aiohttp.ClientSession(
+            headers={"Authorization": self.auth_header},
+            connector=connector,
+            json_serialize=codec.dumps,
+        )
+
+        try:
+            version_status, errmsg = await self.check_version(
+                self.min_app_version, self.max_app_version
+            )
+            if not version_status:
+                raise RuntimeError(errmsg)
+
+            self.session_uuid = await self.create_session(self.session_type)
+            if not self.session_uuid:
+                raise RuntimeError("Failed to create session")
+            self.log.debug("Session uuid: %s", self.session_uuid)
+
+            if self.preload:
+                await self.preload_schemas()
+
+            self.keepalive_interval = keepalive_interval(
+                await self.session_metadata(), RestClient.default_keepalive_interval
+            )
+        except BaseException:
+            # Do not leave a new session open on the server
+            if self.session_uuid:
+                with contextlib.suppress(RuntimeError):
+                    await self._perform_request(
+                        "DELETE", "/sessions/" + self.session_uuid
+                    )
+                self.session_uuid = None
+            await self.session.close()
+            raise
+        self.keepalive_task = asyncio.create_task(self.send_keepalives())
+        return self
+
+    async def quit(self):
+        if self.keepalive_task is not None:
+            self.keepalive_task.cancel()
+            try:
+                await self.keepalive_task
+            except asyncio.CancelledError:
+                pass
+            self.keepalive_task = None
+        try:
+            if self.session_uuid:
+                await self._perform_request("DELETE", "/sessions/" + self.session_uuid)
+        finally:
+            self.session_uuid = None
+            await self.session.close()
+
+    def _build_url(self, path, params=""):
+        url = "http://" + self.hostname + ":" + str(self.port) + path
+        if self.session_uuid:
+            url += "?session_uuid=" + self.session_uuid
+            if len(params) > 0:
+                url += "&" + params
+        else:
+            if len(params) > 0:
+                url += "?" + params
+        return url
+
+    async def _send_request(self, method, path, params="", **kwargs):
+        url = self._build_url(path, params)
+        async with self.session.request(method, url, **kwargs) as response:
+            content = await response.read()
+            self._last_request_time = time.monotonic()
+            return response.status, content
+
+    async def _perform_request(self, method, path, params="", **kwargs):
+        try:
+            status, content = await self._send_request(method, path, params, **kwargs)
+        except aiohttp.ClientError as e:
+            raise RuntimeError(
+                "Failed %s request with error %s" % (method, e)
+            ) from None
+        if status >= 400:
+            raise RuntimeError(
+                "Failed %s request with error %s" % (method, content.decode("utf-8"))
+            )
+        return content
+
+    async def create_local_object(self, keyword, json_object):
+        cls = await self.object_class(keyword, json_object)
+        return cls(json_object, self, True)
+
+    async def object_class(self, keyword, json_object=None):
+        schema_location = object_schema_location(
+            self.schema_root(), keyword, json_object
+        )
+        cls = self._class_cache.get(schema_location)
+        if cls is None:
+            schema_properties = await self.schema_properties(schema_location)
+            cls = object.create_class(keyword, schema_properties, schema_location)
+            self._class_cache[schema_location] = cls
+        return cls
+
+    def schema_root(self):
+        return "/openapi.json"
+
+    async def schema_list(self):
+        return await self.schema(self.schema_root() + "/components/object_schemas")
+
+    async def schema(self, location):
+        location = self._full_schema_location(location)
+        schema = self._schema_cache.get(location)
+        if schema is None:
+            schema = codec.loads(await self._perform_request("GET", location))
+            self._schema_cache[location] = schema
+        return schema
+
+    def _full_schema_location(self, location):
+        return full_schema_location(self.schema_root(), location)
+
+    def schema_location_from_keyword(self, keyword):
+        return schema_location_from_keyword(self.schema_root(), keyword)
+
+    async def schema_properties(self, full_schema_location):
+        full_schema_location = self._full_schema_location(full_schema_location)
+        properties = self._schema_properties_cache.get(full_schema_location)
+        if properties is not None:
+            return properties
+
+        full_schema = await self.schema(full_schema_location)
+        properties = merge_schema_properties(
+            full_schema,
+            {
+                location: await self.schema_properties(location)
+                for location in schema_references(full_schema)
+            },
+        )
+
+        self._schema_properties_cache[full_schema_location] = properties
+        return properties
+
+    async def preload_schemas(self):
+        schemas = await self.schema_list()
+        for keyword, schema in schemas.items():
+            self._schema_cache[self.schema_location_from_keyword(keyword)] = schema
+
+    def clear_schema_cache(self):
+        self._schema_cache.clear()
+        self._schema_properties_cache.clear()
+        self._class_cache.clear()
+
+    async def execute(self, object_uuid, method_name, arguments):
+        value = codec.loads(
+            await self._perform_request(
+                "POST",
+                "/objects/" + object_uuid + "/methods/" + method_name,
+                json=arguments,
+            )
+        )
+
+        if isinstance(value, dict) and value:
+            if "keyword" in value:
+                cls = await self.object_class(value["keyword"], value)
+                return cls(value, self, True)
+
+        return value
+
+    async def app_info(self):
+        return json_text_to_object(await self._perform_request("GET", "/app/info"))
+
+    async def create_session(self, session_type):
+        response = json_text_to_object(
+            await self._perform_request(
+                "POST", "/sessions/?type=" + session_type.name, json=""
+            )
+        )
+        return response.uuid
+
+    async def session_metadata(self):
+        return json_text_to_object(
+            await self._perform_request("OPTIONS", "/sessions/" + self.session_uuid)
+        )
+
+    async def send_keepalive(self):
+        await self._perform_request("PUT", "/sessions/" + self.session_uuid, json="")
+
+    # A failing session may mean that the server has restarted, possibly with
+    # another version and other schemas
+    async def _recheck_version(self):
+        try:
+            await self.check_version(self.min_app_version, self.max_app_version)
+        except RuntimeError as e:
+            self.log.debug("Failed to check the server version: %s", e)
+
+    async def send_keepalives(self):
+        while True:
+            wait_time = self.keepalive_interval - (
+                    time.monotonic() - self._last_request_time
+            )
+            if wait_time <= 0:
+                try:
+                    await self.send_keepalive()
+                except RuntimeError as e:
+                    self.log.warning("Failed to send keepalive: %s", e)
+                    await self._recheck_version()
+                wait_time = self.keepalive_interval
+            await asyncio.sleep(wait_time)
+
+    async def document(self, document_id):
+        assert len(document_id) > 0
+        json_object = codec.loads(
+            await self._perform_request(
+                "GET", "/documents/" + document_id, "skeleton=true"
+            )
+        )
+        cls = await self.object_class(json_object["keyword"], json_object)
+        return cls(json_object, self, False)
+
+    async def get_field_values(self, object_uuid, field_names):
+        values = {}
+        object_get_failed = False
+        if self._supports_object_get is not False:
+            try:
+                status, content = await self._send_request(
+                    "GET", "/objects/" + object_uuid
+                )
+            except aiohttp.ClientError as e:
+                raise RuntimeError("Failed GET request with error %s" % e) from None
+            if status in (404, 405, 501):
+                object_get_failed = True
+            elif status >= 400:
+                raise RuntimeError(
+                    "Failed GET request with error %s" % content.decode("utf-8")
+                )
+            else:
+                self._supports_object_get = True
+                json_object = codec.loads(content)
+                for field_name in field_names:
+                    if field_name in json_object:
+                        values[field_name] = json_object[field_name]
+
+        missing_names = [name for name in field_names if name not in values]
+        fetched_contents = await asyncio.gather(
+            *[self.get_field_value(object_uuid, name) for name in missing_names]
+        )
+        for field_name, content in zip(missing_names, fetched_contents):
+            values[field_name] = codec.loads(content)
+
+        if object_get_failed:
+            self._supports_object_get = False
+        return values
+
+    async def get_field_value(self, object_uuid, field_name):
+        return await self._perform_request(
+            "GET", "/objects/" + object_uuid + "/fields/" + field_name
+        )
+
+    async def set_field_value(self, object_uuid, field_name, json_value):
+        return await self._perform_request(
+            "PUT",
+            "/objects/" + object_uuid + "/fields/" + field_name,
+            json=json_value,
+        )
+
+    async def set_field_values(self, object_uuid, values):
+        object_put_failed = False
+        if self._supports_object_put is not False:
+            json_values = {
+                key: arrays.to_json_value(value) for key, value in values.items()
+            }
+            try:
+                status, content = await self._send_request(
+                    "PUT", "/objects/" + object_uuid, json=json_values
+                )
+            except aiohttp.ClientError as e:
+                raise RuntimeError("Failed PUT request with error %s" % e) from None
+            if status in (404, 405, 501):
+                object_put_failed = True
+            elif status >= 400:
+                raise RuntimeError(
+                    "Failed PUT request with error %s" % content.decode("utf-8")
+                )
+            else:
+                self._supports_object_put = True
+                return
+
+        # No batch endpoint: write the fields in order
+        for field_name, json_value in values.items():
+            await self.set_field_value(
+                object_uuid, field_name, arrays.to_json_value(json_value)
+            )
+
+        if object_put_failed:
+            self._supports_object_put = False
+
+    async def check_version(self, min_app_version, max_app_version):
+        app_info = await self.app_info()
+        app_version = (
+            app_info.name,
+            app_info.major_version,
+            app_info.minor_version,
+            app_info.patch_version,
+        )
+        if self._app_version is not None and self._app_version != app_version:
+            self.log.info("Server version changed. Clearing schema cache")
+            self.clear_schema_cache()
+        self._app_version = app_version
+
+        return compare_app_version(
+            self.log, app_info, min_app_version, max_app_version
+        )
@@ -0,0 +1,152 @@
+###################################################################################################
+#
+#   Caffa
+#   Copyright (C) Kontur AS
+#
+#   GNU Lesser General Public License Usage
+#   This library is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation; either version 2.1 of the License, or
+#   (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful, but WITHOUT ANY
+#   WARRANTY; without even the implied warranty of MERCHANTABILITY or
+#   FITNESS FOR A PARTICULAR PURPOSE.
+#
+#   See the GNU Lesser General Public License at <<http:#www.gnu.org/licenses/lgpl-2.1.html>>
+#   for more details.
+#
+import atexit
+import hashlib
+import logging
+import threading
+import time
+
+from .restclient import RestClient, SessionType
+
+
+class ClientPool:
+    # Seconds an unused client is kept (with its session alive) before it is closed
+    idle_timeout = 30.0
+
+    def __init__(self, idle_timeout=None):
+        if idle_timeout is None:
+            idle_timeout = ClientPool.idle_timeout
+        self.idle_timeout = idle_timeout
+        self.log = logging.getLogger("caffa-client-pool")
+        self._clients = {}
+        self._reference_counts = {}
+        self._idle_since = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+
+    def acquire(
+            self,
+            hostname,
+            port=50000,
+            username="",
+            password="",
+            session_type=SessionType.REGULAR,
+            **kwargs,
+    ):
+        # The password is part of the key so a session is only shared with
+        # callers presenting the same credentials. So are the other client
+        # options, so callers never get a client configured for someone else.
+        # Options such as caches, metrics and transports are compared by identity.
+        key = (
+            hostname,
+            port,
+            username,
+            hashlib.sha256(password.encode("utf-8")).hexdigest(),
+            session_type,
+            tuple(sorted(kwargs.items())),
+        )
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._reference_counts[key] += 1
+                self._idle_since.pop(key, None)
+                return client
+
+        # Connect without holding the lock, since the handshake is slow
+        new_client = RestClient(
+            hostname, port, username, password, session_type=session_type, **kwargs
+        )
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                new_client._pool = self
+                new_client._pool_key = key
+                self._clients[key] = new_client
+                self._reference_counts[key] = 1
+                return new_client
+            self._reference_counts[key] += 1
+            self._idle_since.pop(key, None)
+
+        # Another thread connected first
+        new_client.quit()
+        return client
+
+    def release(self, client):
+        key = client._pool_key
+        with self._lock:
+            if self._clients.get(key) is not client:
+                return
+            if self._reference_counts[key] == 0:
+                self.log.warning("Pooled client released more often than acquired")
+                return
+            self._reference_counts[key] -= 1
+            if self._reference_counts[key] > 0:
+                return
+            self._idle_since[key] = time.monotonic()
+            self._schedule_reaper()
+
+    def reap(self):
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            self._reaper = None
+            for key, idle_since in list(self._idle_since.items()):
+                if now - idle_since >= self.idle_timeout:
+                    expired.append(self._remove(key))
+            if self._idle_since:
+                self._schedule_reaper()
+
+        for client in expired:
+            self._close_client(client)
+
+    def close_all(self):
+        with self._lock:
+            if self._reaper is not None:
+                self._reaper.cancel()
+                self._reaper = None
+            clients = [self._remove(key) for key in list(self._clients)]
+
+        for client in clients:
+            self._close_client(client)
+
+    def __len__(self):
+        return len(self._clients)
+
+    def _schedule_reaper(self):
+        if self._reaper is None:
+            self._reaper = threading.Timer(self.idle_timeout, self.reap)
+            self._reaper.daemon = True
+            self._reaper.start()
+
+    def _remove(self, key):
+        client = self._clients.pop(key)
+        self._reference_counts.pop(key, None)
+        self._idle_since.pop(key, None)
+        client._pool = None
+        return client
+
+    def _close_client(self, client):
+        try:
+            client.quit()
+        except RuntimeError as e:
+            self.log.warning("Failed to close pooled client: %s", e)
+
+
+default_pool = ClientPool()
+atexit.register(default_pool.close_all)
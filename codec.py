@@ -0,0 +1,148 @@
+###################################################################################################
+#
+#   Caffa
+#   Copyright (C) Kontur AS
+#
+#   GNU Lesser General Public License Usage
+#   This library is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation; either version 2.1 of the License, or
+#   (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful, but WITHOUT ANY
+#   WARRANTY; without even the implied warranty of MERCHANTABILITY or
+#   FITNESS FOR A PARTICULAR PURPOSE.
+#
+#   See the GNU Lesser General Public License at <<http:#www.gnu.org/licenses/lgpl-2.1.html>>
+#   for more details.
+#
+import json
+from types import SimpleNamespace
+
+from . import arrays
+
+# JSON encoding and decoding for the client. The fastest available backend of
+# orjson, msgspec and ujson is used, with the standard library json as fallback.
+# loads() accepts both str and bytes, dumps_bytes() produces UTF-8 encoded bytes.
+
+CONTENT_TYPE = "application/json"
+
+
+def _default(value):
+    if arrays.is_array(value):
+        return value.tolist()
+    raise TypeError("Object of type %s is not JSON serializable" % type(value).__name__)
+
+
+class StdlibBackend:
+    name = "json"
+
+    @staticmethod
+    def loads(data):
+        return json.loads(data)
+
+    @staticmethod
+    def dumps_bytes(value):
+        return json.dumps(value, default=_default).encode("utf-8")
+
+
+class OrjsonBackend:
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+
+        self._orjson = orjson
+        self.loads = orjson.loads
+        self._option = orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps_bytes(self, value):
+        return self._orjson.dumps(value, default=_default, option=self._option)
+
+
+class MsgspecBackend:
+    name = "msgspec"
+
+    def __init__(self):
+        import msgspec
+
+        self._decoder = msgspec.json.Decoder()
+        self._encoder = msgspec.json.Encoder(enc_hook=_default)
+        self.loads = self._decoder.decode
+
+    def dumps_bytes(self, value):
+        return self._encoder.encode(value)
+
+
+class UjsonBackend:
+    name = "ujson"
+
+    def __init__(self):
+        import ujson
+
+        self._ujson = ujson
+        self.loads = ujson.loads
+
+    def dumps_bytes(self, value):
+        return self._ujson.dumps(value, default=_default).encode("utf-8")
+
+
+_BACKENDS = {
+    "orjson": OrjsonBackend,
+    "msgspec": MsgspecBackend,
+    "ujson": UjsonBackend,
+    "json": StdlibBackend,
+}
+
+_backend = None
+
+
+def backend_name():
+    return _backend.name
+
+
+# Select a backend by name ("orjson", "msgspec", "ujson" or "json"), or the
+# fastest available one if name is None
+def use_backend(name=None):
+    global _backend
+    if name is not None:
+        _backend = _BACKENDS[name]()
+        return _backend.name
+
+    for backend_class in _BACKENDS.values():
+        try:
+            _backend = backend_class()
+            break
+        except ImportError:
+            continue
+    return _backend.name
+
+
+def loads(data):
+    return _backend.loads(data)
+
+
+def dumps_bytes(value):
+    return _backend.dumps_bytes(value)
+
+
+def dumps(value):
+    return _backend.dumps_bytes(value).decode("utf-8")
+
+
+# Decode JSON into SimpleNamespace objects for attribute access
+def loads_namespace(data):
+    return _to_namespace(_backend.loads(data))
+
+
+def _to_namespace(value):
+    if isinstance(value, dict):
+        return SimpleNamespace(
+            **{key: _to_namespace(item) for key, item in value.items()}
+        )
+    if isinstance(value, list):
+        return [_to_namespace(item) for item in value]
+    return value
+
+
+use_backend()
@@ -0,0 +1,51 @@
+###################################################################################################
+#
+#   Caffa
+#   Copyright (C) Kontur AS
+#
+#   GNU Lesser General Public License Usage
+#   This library is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation; either version 2.1 of the License, or
+#   (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful, but WITHOUT ANY
+#   WARRANTY; without even the implied warranty of MERCHANTABILITY or
+#   FITNESS FOR A PARTICULAR PURPOSE.
+#
+#   See the GNU Lesser General Public License at <<http:#www.gnu.org/licenses/lgpl-2.1.html>>
+#   for more details.
+#
+import gzip
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    # zstd request compression is optional
+    zstandard = None
+
+# Compression of HTTP bodies in both directions.
+#
+# Responses: requests asks for every encoding urllib3 can decode (gzip and
+# deflate, plus br and zstd if brotli or zstandard is installed). Responses are
+# decoded as they are read, so streamed field values stay bounded in memory.
+#
+# Requests: bodies are only compressed when the client is asked to with
+# compress_requests, using one of ENCODERS. Servers do not reliably say whether
+# they take compressed bodies, so this is never turned on automatically.
+
+
+def _zstd_compress(data):
+    return zstandard.ZstdCompressor().compress(data)
+
+
+# Request body encoders by preference
+ENCODERS = {"gzip": lambda data: gzip.compress(data, compresslevel=6)}
+if zstandard is not None:
+    ENCODERS = {"zstd": _zstd_compress, **ENCODERS}
+ENCODERS["deflate"] = lambda data: zlib.compress(data, 6)
+
+
+def compress(data, encoding):
+    return ENCODERS[encoding](data)
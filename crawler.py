@@ -0,0 +1,109 @@
+###################################################################################################
+#
+#   Caffa
+#   Copyright (C) Kontur AS
+#
+#   GNU Lesser General Public License Usage
+#   This library is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation; either version 2.1 of the License, or
+#   (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful, but WITHOUT ANY
+#   WARRANTY; without even the implied warranty of MERCHANTABILITY or
+#   FITNESS FOR A PARTICULAR PURPOSE.
+#
+#   See the GNU Lesser General Public License at <<http:#www.gnu.org/licenses/lgpl-2.1.html>>
+#   for more details.
+#
+
+_OBJECT_KEYS = ("keyword", "uuid", "$id")
+
+
+# Load a document breadth-first into a local object graph, reading the objects
+# of each level concurrently with up to max_concurrency requests in flight.
+#
+# depth limits how many levels below the document are read (None reads all).
+# Objects below that depth are kept as returned inline by their parent.
+# fields is either a list of field names to read for every object, or a dict of
+# lists by object keyword. Objects are deduplicated by uuid, so an object
+# referenced from several places is represented by the same local data.
+# With compact=True the graph is returned as CompactObjects.
+def load_tree(
+        client, document_id, depth=None, fields=None, max_concurrency=8, compact=False
+):
+    nodes = {}
+    root = object_node(client.document_skeleton(document_id))
+    nodes[root["uuid"]] = root
+
+    level = [root]
+    level_depth = 0
+    with client.create_executor(max_concurrency) as executor:
+        while level:
+            results = executor.map(
+                lambda node: _read_fields(client, node, fields), level
+            )
+            next_level = []
+            read_children = depth is None or level_depth < depth
+            for node, values in zip(level, results):
+                for field_name, value in values.items():
+                    node[field_name] = link_objects(
+                        value, nodes, next_level, read_children
+                    )
+            level = next_level
+            level_depth += 1
+
+    return client.create_local_object(root["keyword"], root, compact)
+
+
+# The local data of an object, starting out with just its identifying keys
+def object_node(json_object):
+    return {key: json_object[key] for key in _OBJECT_KEYS if key in json_object}
+
+
+def is_object(value):
+    return isinstance(value, dict) and "keyword" in value and "uuid" in value
+
+
+# The names of the fields to read for an object, limited by fields as for load_tree()
+def object_field_names(client, node, fields):
+    schema_location = client.object_schema_location(node["keyword"], node)
+    names = []
+    for name, prop in client.schema_properties(schema_location).items():
+        if name in _OBJECT_KEYS or name == "methods":
+            continue
+        if "writeOnly" in prop and prop["writeOnly"]:
+            continue
+        names.append(name)
+
+    if isinstance(fields, dict):
+        fields = fields.get(node["keyword"])
+    if fields is not None:
+        names = [name for name in names if name in fields]
+    return names
+
+
+def _read_fields(client, node, fields):
+    names = object_field_names(client, node, fields)
+    if not names:
+        return {}
+    return client.get_field_values(node["uuid"], names)
+
+
+# Replace child objects in a field value with the shared node for their uuid,
+# queueing the ones not seen before to be read on the next level
+def link_objects(value, nodes, next_level, read_children):
+    if isinstance(value, list):
+        return [link_objects(item, nodes, next_level, read_children) for item in value]
+    if not is_object(value):
+        return value
+
+    node = nodes.get(value["uuid"])
+    if node is None:
+        if read_children:
+            node = object_node(value)
+            next_level.append(node)
+        else:
+            node = value
+        nodes[value["uuid"]] = node
+    return node
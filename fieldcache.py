@@ -0,0 +1,146 @@
+###################################################################################################
+#
+#   Caffa
+#   Copyright (C) Kontur AS
+#
+#   GNU Lesser General Public License Usage
+#   This library is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation; either version 2.1 of the License, or
+#   (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful, but WITHOUT ANY
+#   WARRANTY; without even the implied warranty of MERCHANTABILITY or
+#   FITNESS FOR A PARTICULAR PURPOSE.
+#
+#   See the GNU Lesser General Public License at <<http:#www.gnu.org/licenses/lgpl-2.1.html>>
+#   for more details.
+#
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from . import codec
+
+
+class FieldCache:
+    # Bounded LRU cache of field values as returned by the server, keyed by
+    # (object uuid, field name). Entries expire after ttl seconds if a ttl is given.
+    # Values are stored as received (encoded JSON) so callers can never mutate them.
+    #
+    # Reads take the generation before requesting a value and pass it to put(). If
+    # the cache was invalidated in the meantime the value may be stale, and put()
+    # drops it.
+    def __init__(self, max_size=4096, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, object_uuid, field_name):
+        key = (object_uuid, field_name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expiry, value = entry
+                if expiry is None or expiry > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+        return None
+
+    def put(self, object_uuid, field_name, value, generation=None):
+        expiry = None
+        if self.ttl is not None:
+            expiry = time.monotonic() + self.ttl
+        key = (object_uuid, field_name)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (expiry, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    # Drop a single field, or all cached fields of an object if field_name is None.
+    # This is the hook for change notifications from an observing session.
+    def invalidate(self, object_uuid, field_name=None):
+        with self._lock:
+            self.generation += 1
+            if field_name is not None:
+                self._entries.pop((object_uuid, field_name), None)
+            else:
+                for key in [key for key in self._entries if key[0] == object_uuid]:
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    # The cached values of each object, as {object uuid: {field name: value}}
+    def objects(self):
+        now = time.monotonic()
+        objects = {}
+        with self._lock:
+            for (object_uuid, field_name), (expiry, value) in self._entries.items():
+                if expiry is None or expiry > now:
+                    objects.setdefault(object_uuid, {})[field_name] = value
+        return objects
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class FieldCacheObserver:
+    # Keeps a field cache in line with the server by checking the cached objects
+    # every interval seconds through a separate observing session, and invalidating
+    # the fields that have changed. Servers that provide entity tags answer
+    # unchanged objects with 304 Not Modified, so a check costs one small request
+    # per cached object. Other servers send the fields every time.
+    def __init__(self, client, field_cache, interval):
+        self.client = client
+        self.field_cache = field_cache
+        self.interval = interval
+        self.log = logging.getLogger("caffa-field-cache")
+        self._etags = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._observe, daemon=True)
+        self._thread.start()
+
+    # Check all cached objects once. Returns the number of fields invalidated.
+    def check(self):
+        invalidated = 0
+        etags = {}
+        for object_uuid, cached_values in self.field_cache.objects().items():
+            values, etags[object_uuid] = self.client.get_changed_field_values(
+                object_uuid, list(cached_values), self._etags.get(object_uuid)
+            )
+            if values is None:
+                continue
+            for field_name, json_text in cached_values.items():
+                if values.get(field_name) != codec.loads(json_text):
+                    self.field_cache.invalidate(object_uuid, field_name)
+                    invalidated += 1
+        # Forget the objects that have left the cache
+        self._etags = etags
+        return invalidated
+
+    def _observe(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except RuntimeError as e:
+                self.log.warning("Failed to check cached fields: %s", e)
+
+    # Stop checking and close the observing session
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.client.quit()
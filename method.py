@@ -16,41 +16,60 @@
 #   See the GNU Lesser General Public License at <<http:#www.gnu.org/licenses/lgpl-2.1.html>>
 #   for more details.
 #
-import json
 import logging
 
+from . import arrays
+
 
 class Method:
     _log = logging.getLogger("caffa-method")
-    _labelled_arguments = {}
-    _positional_arguments = {}
+
+    # Argument spec, set once per method class by create_method_class. Positional
+    # arguments map to labelled arguments by index.
+    _labelled_argument_names = ()
+    _positional_argument_count = 0
 
     def __init__(self, self_object):
         self._self_object = self_object
 
     def __call__(self, *args, **kwargs):
-        from .object import Object
-
+        # Arguments are built per call, so concurrent calls never share state
+        cls = self.__class__
         arguments = {}
-        if len(kwargs.items()) > 0:
-            arguments["labelledArguments"] = self.__class__._labelled_arguments[
-                self.__class__.__name__
-            ]
+        if kwargs:
+            limit = len(cls._labelled_argument_names)
+            if len(args) > limit:
+                raise TypeError(cls._too_many_arguments(limit, len(args)))
+            labelled_arguments = dict.fromkeys(cls._labelled_argument_names)
+            for key, value in zip(cls._labelled_argument_names, args):
+                labelled_arguments[key] = _argument_value(value)
             for key, value in kwargs.items():
-                if isinstance(value, Object):
-                    value = value.to_dict()
-                arguments["labelledArguments"][key] = value
-        elif len(args) > 0:
-            arguments["positionalArguments"] = self.__class__._positional_arguments[
-                self.__class__.__name__
-            ]
+                labelled_arguments[key] = _argument_value(value)
+            arguments["labelledArguments"] = labelled_arguments
+        elif args:
+            if len(args) > cls._positional_argument_count:
+                raise TypeError(
+                    cls._too_many_arguments(cls._positional_argument_count, len(args))
+                )
+            positional_arguments = [None] * cls._positional_argument_count
             for i, value in enumerate(args):
-                if isinstance(value, Object):
-                    value = value.to_dict()
-                arguments["positionalArguments"][i] = value
+                positional_arguments[i] = _argument_value(value)
+            arguments["positionalArguments"] = positional_arguments
 
         return self._self_object.execute(self, arguments)
 
+    @classmethod
+    def _too_many_arguments(cls, limit, count):
+        return "%s takes %d positional arguments but %d were given" % (
+            cls.__name__,
+            limit,
+            count,
+        )
+
+    # Call the method on the client thread pool, returning a concurrent.futures.Future
+    def submit(self, *args, **kwargs):
+        return self._self_object.client().submit(self, *args, **kwargs)
+
     @classmethod
     def static_name(cls):
         return cls.__name__
@@ -59,6 +78,32 @@ class Method:
         return self.__class__.__name__
 
 
+class MethodDescriptor:
+    # Binds a method class to an object on first access and caches the bound
+    # method in the instance dictionary, which takes precedence on later lookups.
+    def __init__(self, method_class):
+        self._method_class = method_class
+        self._name = method_class.static_name()
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self._method_class
+        method_instance = self._method_class(self_object=instance)
+        # Compact objects have no instance dictionary to cache the method in
+        instance_dict = getattr(instance, "__dict__", None)
+        if instance_dict is not None:
+            instance_dict[self._name] = method_instance
+        return method_instance
+
+
+def _argument_value(value):
+    from .object import ObjectBase
+
+    if isinstance(value, ObjectBase):
+        return value.to_dict()
+    return arrays.to_json_value(value)
+
+
 def make_read_lambda(property_name):
     return lambda self: self_self_object.get(property_name)
 
@@ -71,14 +116,20 @@ def create_method_class(name, schema):
     def __init__(self, self_object):
         return Method.__init__(self, self_object)
 
-    newclass = type(name, (Method,), {"__init__": __init__})
-    newclass._labelled_arguments[name] = {}
-    newclass._positional_arguments[name] = []
+    labelled_argument_names = ()
+    positional_argument_count = 0
     if "labelledArguments" in schema:
-        for argument_name in schema["labelledArguments"]["properties"]:
-            newclass._labelled_arguments[name][argument_name] = None
+        labelled_argument_names = tuple(schema["labelledArguments"]["properties"])
     if "positionalArguments" in schema:
-        for i, entry in enumerate(schema["positionalArguments"]["items"]):
-            newclass._positional_arguments[name].append(None)
-
+        positional_argument_count = len(schema["positionalArguments"]["items"])
+
+    newclass = type(
+        name,
+        (Method,),
+        {
+            "__init__": __init__,
+            "_labelled_argument_names": labelled_argument_names,
+            "_positional_argument_count": positional_argument_count,
+        },
+    )
     return newclass
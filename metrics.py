@@ -0,0 +1,178 @@
+###################################################################################################
+#
+#   Caffa
+#   Copyright (C) Kontur AS
+#
+#   GNU Lesser General Public License Usage
+#   This library is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation; either version 2.1 of the License, or
+#   (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful, but WITHOUT ANY
+#   WARRANTY; without even the implied warranty of MERCHANTABILITY or
+#   FITNESS FOR A PARTICULAR PURPOSE.
+#
+#   See the GNU Lesser General Public License at <<http:#www.gnu.org/licenses/lgpl-2.1.html>>
+#   for more details.
+#
+import contextlib
+import threading
+from bisect import bisect_left
+
+# Request metrics and tracing hooks for a client. Pass a Metrics instance as
+# RestClient(metrics=...) to enable them. Clients without one only pay for an
+# "is None" check per request.
+#
+# For tracing, pass any tracer with the OpenTelemetry Tracer interface, such as
+# opentelemetry.trace.get_tracer("caffa"), as Metrics(tracer=...). Spans are
+# created around document(), execute() and schema resolution.
+#
+# Subclass Metrics and override record_request() to forward requests elsewhere.
+
+_NO_SPAN = contextlib.nullcontext()
+
+# Path segments following these are replaced with a placeholder in path templates
+_PATH_PARAMETERS = {
+    "documents": "{document_id}",
+    "objects": "{uuid}",
+    "sessions": "{session_uuid}",
+}
+
+
+# Reduce a request path to a template, so that requests for different objects
+# are counted together: /objects/<uuid>/fields/name -> /objects/{uuid}/fields/name
+def path_template(path):
+    path = path.split("?", 1)[0]
+    segments = path.split("/")
+    for i in range(1, len(segments)):
+        placeholder = _PATH_PARAMETERS.get(segments[i - 1])
+        if placeholder is not None and segments[i]:
+            segments[i] = placeholder
+    return "/".join(segments)
+
+
+class RequestStats:
+    # Upper bounds in seconds of the latency histogram buckets. The last bucket
+    # counts everything slower than the last bound.
+    latency_buckets = (
+        0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+    )
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.histogram = [0] * (len(self.latency_buckets) + 1)
+
+    @property
+    def mean_time(self):
+        return self.total_time / self.count if self.count else 0.0
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "total_time": self.total_time,
+            "mean_time": self.mean_time,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "latency_buckets": dict(
+                zip(self.latency_buckets + (float("inf"),), self.histogram)
+            ),
+        }
+
+
+class Metrics:
+    def __init__(self, tracer=None):
+        self.tracer = tracer
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = {}
+            self.schema_cache_hits = 0
+            self.schema_cache_misses = 0
+            self.schema_resolution_time = 0.0
+
+    # Called once per HTTP request attempt. status is None if no response arrived.
+    def record_request(self, method, path, status, elapsed, bytes_sent, bytes_received):
+        key = (method, path_template(path))
+        with self._lock:
+            stats = self.requests.get(key)
+            if stats is None:
+                stats = RequestStats()
+                self.requests[key] = stats
+            stats.count += 1
+            if status is None or status >= 400:
+                stats.errors += 1
+            stats.total_time += elapsed
+            stats.bytes_sent += bytes_sent
+            stats.bytes_received += bytes_received
+            stats.histogram[bisect_left(stats.latency_buckets, elapsed)] += 1
+
+    def record_schema_lookup(self, hit, elapsed=0.0):
+        with self._lock:
+            if hit:
+                self.schema_cache_hits += 1
+            else:
+                self.schema_cache_misses += 1
+                self.schema_resolution_time += elapsed
+
+    # A context manager around an operation. Yields the tracer span, or None
+    # if there is no tracer.
+    def span(self, name, attributes=None):
+        if self.tracer is None:
+            return _NO_SPAN
+        return self.tracer.start_as_current_span(name, attributes=attributes)
+
+    @property
+    def request_count(self):
+        return sum(stats.count for stats in self.requests.values())
+
+    @property
+    def bytes_sent(self):
+        return sum(stats.bytes_sent for stats in self.requests.values())
+
+    @property
+    def bytes_received(self):
+        return sum(stats.bytes_received for stats in self.requests.values())
+
+    @property
+    def schema_cache_hit_rate(self):
+        lookups = self.schema_cache_hits + self.schema_cache_misses
+        return self.schema_cache_hits / lookups if lookups else 0.0
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": {
+                    method + " " + template: stats.to_dict()
+                    for (method, template), stats in self.requests.items()
+                },
+                "request_count": self.request_count,
+                "bytes_sent": self.bytes_sent,
+                "bytes_received": self.bytes_received,
+                "schema_cache_hits": self.schema_cache_hits,
+                "schema_cache_misses": self.schema_cache_misses,
+                "schema_cache_hit_rate": self.schema_cache_hit_rate,
+                "schema_resolution_time": self.schema_resolution_time,
+            }
+
+    # A table of the most frequent requests. Templates with a high count relative
+    # to the work done point to N+1 request patterns.
+    def report(self, limit=20):
+        with self._lock:
+            rows = sorted(
+                self.requests.items(), key=lambda item: item[1].count, reverse=True
+            )
+        lines = ["%8s %8s %10s  %s" % ("count", "errors", "mean ms", "request")]
+        for (method, template), stats in rows[:limit]:
+            lines.append(
+                "%8d %8d %10.2f  %s %s"
+                % (stats.count, stats.errors, stats.mean_time * 1000, method, template)
+            )
+        return "\n".join(lines)
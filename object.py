@@ -16,33 +16,40 @@
 #   See the GNU Lesser General Public License at <<http:#www.gnu.org/licenses/lgpl-2.1.html>>
 #   for more details.
 #
+import contextlib
+import hashlib
 import json
 import logging
+import threading
 
-from .method import Method, create_method_class
+from . import arrays, codec, streaming
+from .method import Method, MethodDescriptor, create_method_class
 
 
-class Object(object):
+class ObjectBase(object):
+    # Behaviour shared by Object and CompactObject. Slotted, so that CompactObject
+    # instances have no __dict__. Use Object for regular objects.
+    __slots__ = ()
+
     _log = logging.getLogger("caffa-object")
 
     _methods = []
+    _array_dtypes = {}
+    _batch = None
     __frozen = False
 
     @classmethod
     def prep_attributes(cls):
-        setattr(cls, "_fields", None)
-        setattr(cls, "_client", None)
-        setattr(cls, "_local", None)
-        setattr(cls, "_method_list", None)
-        for method in cls._methods:
-            setattr(cls, method.static_name(), None)
+        for name in ("_fields", "_client", "_local"):
+            if not hasattr(cls, name):
+                setattr(cls, name, None)
         cls.__frozen = True
 
     def __init__(self, json_object="", client=None, local=False):
         if isinstance(json_object, dict):
             self._fields = json_object
         else:
-            self._fields = json.loads(json_object)
+            self._fields = codec.loads(json_object)
 
         self._client = client
         self._local = local
@@ -50,35 +57,41 @@ class Object(object):
         if not self._local:
             assert self._client is not None
 
-        self._method_list = []
-        for method in self.__class__._methods:
-            method_instance = method(self_object=self)
-            setattr(self, method.static_name(), method_instance)
-            self._method_list.append(method_instance)
-
     @property
     def keyword(self):
         return self._fields["keyword"]
 
     def __setattr__(self, key, value):
-        if not hasattr(self, key) and self.__class__.__frozen:
+        # Look the name up without reading it, as reading a field is a request
+        if self.__class__.__frozen and not (
+                hasattr(self.__class__, key) or key in getattr(self, "__dict__", ())
+        ):
             raise TypeError("%r does not have the property %s", self, key)
         object.__setattr__(self, key, value)
 
     def client(self):
         return self._client
 
+    # The client for blocking reads and writes of a remote object. Remote objects
+    # of an AsyncRestClient have to use aget(), aget_many(), aset() and aset_fields().
+    def _sync_client(self):
+        if self._client.is_async:
+            raise TypeError(
+                "%s belongs to an AsyncRestClient. Use aget(), aget_many(), aset() "
+                "and aset_fields() instead" % self.__class__.__name__
+            )
+        return self._client
+
     def to_dict(self):
         content = {}
-        for key in self._fields:
-            value = self.get(key)
-            if isinstance(value, Object):
+        for key, value in self.get_many(list(self._fields)).items():
+            if isinstance(value, ObjectBase):
                 value = value.to_dict()
-            content[key] = value
+            content[key] = arrays.to_json_value(value)
         return content
 
     def to_json(self):
-        return json.loads(self.to_string())
+        return self.to_dict()
 
     def field_keywords(self):
         keywords = []
@@ -88,32 +101,160 @@ class Object(object):
 
     def get(self, field_keyword):
         value = None
-        if not self._local and field_keyword != "keyword" and field_keyword != "uuid":
-            value = json.loads(
-                self._client.get_field_value(self._fields["uuid"], field_keyword)
+        if self._batch is not None and field_keyword in self._batch:
+            value = self._batch[field_keyword]
+        elif not self._local and field_keyword != "keyword" and field_keyword != "uuid":
+            client = self._sync_client()
+            dtype = self._numpy_dtype(field_keyword)
+            if dtype is not None:
+                return client.get_field_array(
+                    self._fields["uuid"], field_keyword, dtype
+                )
+            value = codec.loads(
+                client.get_field_value(self._fields["uuid"], field_keyword)
             )
         elif self._fields and field_keyword in self._fields:
             value = self._fields[field_keyword]
 
-        if isinstance(value, dict):
-            keyword = value["keyword"]
-            schema_location = ""
-            if "$id" in value:
-                schema_location = value["$id"]
-            else:
-                schema_location = self._client.schema_location_from_keyword(keyword)
+        return self._wrap_value(value, field_keyword)
+
+    def get_many(self, field_keywords):
+        values = {}
+        remote_keywords = []
+        for field_keyword in field_keywords:
+            if self._batch is not None and field_keyword in self._batch:
+                values[field_keyword] = self._batch[field_keyword]
+            elif (
+                    not self._local
+                    and field_keyword != "keyword"
+                    and field_keyword != "uuid"
+            ):
+                remote_keywords.append(field_keyword)
+            elif self._fields and field_keyword in self._fields:
+                values[field_keyword] = self._fields[field_keyword]
+
+        if remote_keywords:
+            values.update(
+                self._sync_client().get_field_values(
+                    self._fields["uuid"], remote_keywords
+                )
+            )
+        return {
+            field_keyword: self._wrap_value(values.get(field_keyword), field_keyword)
+            for field_keyword in field_keywords
+        }
+
+    # Coroutine variants of get(), get_many() and set() for objects
+    # belonging to an AsyncRestClient
+    async def aget(self, field_keyword):
+        return (await self.aget_many([field_keyword]))[field_keyword]
+
+    async def aget_many(self, field_keywords):
+        values = {}
+        remote_keywords = []
+        for field_keyword in field_keywords:
+            if self._batch is not None and field_keyword in self._batch:
+                values[field_keyword] = self._batch[field_keyword]
+            elif (
+                    not self._local
+                    and field_keyword != "keyword"
+                    and field_keyword != "uuid"
+            ):
+                remote_keywords.append(field_keyword)
+            elif self._fields and field_keyword in self._fields:
+                values[field_keyword] = self._fields[field_keyword]
+
+        if len(remote_keywords) == 1:
+            values[remote_keywords[0]] = codec.loads(
+                await self._client.get_field_value(
+                    self._fields["uuid"], remote_keywords[0]
+                )
+            )
+        elif remote_keywords:
+            values.update(
+                await self._client.get_field_values(
+                    self._fields["uuid"], remote_keywords
+                )
+            )
 
-            schema_properties = self._client.schema_properties(schema_location)
-            cls = create_class(keyword, schema_properties)
+        content = {}
+        for field_keyword in field_keywords:
+            value = values.get(field_keyword)
+            if isinstance(value, dict):
+                cls = await self._client.object_class(value["keyword"], value)
+                value = cls(value, self._client, self._local)
+            content[field_keyword] = value
+        return content
+
+    async def aset(self, field_keyword, value):
+        if self._local:
+            return self.set(field_keyword, value)
+        if isinstance(value, ObjectBase):
+            value = value.to_json()
+        await self._client.set_field_value(self.uuid, field_keyword, value)
+
+    async def aset_fields(self, **kwargs):
+        if self._local:
+            return self.set_fields(**kwargs)
+        values = {}
+        for key, value in kwargs.items():
+            if isinstance(value, ObjectBase):
+                value = value.to_json()
+            values[key] = value
+        await self._client.set_field_values(self.uuid, values)
+
+    def _numpy_dtype(self, field_keyword):
+        if self._client is None or not getattr(self._client, "numpy_arrays", False):
+            return None
+        return self.__class__._array_dtypes.get(field_keyword)
+
+    def _wrap_value(self, value, field_keyword=None):
+        # The class of a child object may have to be fetched, which an
+        # AsyncRestClient cannot do here. aget() wraps child objects instead.
+        if isinstance(value, dict) and not self._client.is_async:
+            cls = self._client.object_class(value["keyword"], value)
             value = cls(value, self._client, self._local)
+        elif isinstance(value, list) and field_keyword is not None:
+            dtype = self._numpy_dtype(field_keyword)
+            if dtype is not None:
+                value = arrays.numpy.asarray(value, dtype=dtype)
         return value
 
+    # Iterate over an array valued field in batches of up to chunk elements
+    # without holding the whole value in memory. Batches are NumPy arrays if the
+    # client returns arrays as NumPy arrays, and lists otherwise.
+    def iter_field(self, field_keyword, chunk=65536):
+        dtype = self._numpy_dtype(field_keyword)
+        if self._local:
+            elements = iter(self._fields[field_keyword])
+        else:
+            elements = self._sync_client().iter_field_value(
+                self._fields["uuid"], field_keyword, chunk_size=chunk
+            )
+        return streaming.iter_batches(elements, chunk, dtype)
+
+    # Write a field value straight to a binary file object or preallocated array
+    def download_field(self, field_keyword, target, chunk_size=65536):
+        if self._local:
+            raise RuntimeError("Cannot download fields of a local object")
+        return self._sync_client().download_field_value(
+            self._fields["uuid"], field_keyword, target, chunk_size
+        )
+
     def set(self, field_keyword, value):
-        if isinstance(value, Object):
+        if isinstance(value, ObjectBase):
             value = value.to_json()
-        if not self._local:
-            self._client.set_field_value(self.uuid, field_keyword, value)
+        if self._batch is not None:
+            self._batch[field_keyword] = value
+        elif not self._local:
+            self._sync_client().set_field_value(
+                self.uuid,
+                field_keyword,
+                value,
+                self.__class__._array_dtypes.get(field_keyword),
+            )
         else:
+            value = arrays.to_json_value(value)
             if hasattr(self._fields[field_keyword], "value"):
                 self._fields[field_keyword]["value"] = value
             else:
@@ -123,22 +264,193 @@ class Object(object):
         self._fields[keyword] = {"type": type, "value": value}
 
     def set_fields(self, **kwargs):
+        if self._local or self._batch is not None:
+            for key, value in kwargs.items():
+                self.set(key, value)
+            return
+
+        values = {}
         for key, value in kwargs.items():
-            self.set(key, value)
+            if isinstance(value, ObjectBase):
+                value = value.to_json()
+            values[key] = value
+        self._sync_client().set_field_values(self.uuid, values)
+
+    # Queue field assignments made inside the with-block and write them all
+    # in one batch on exit. Queued values are discarded if the block raises.
+    # Objects of an AsyncRestClient use aset_fields() instead.
+    @contextlib.contextmanager
+    def batch(self):
+        if self._batch is not None:
+            yield self
+            return
+        if not self._local:
+            self._sync_client()
+
+        self._batch = {}
+        try:
+            yield self
+            pending = self._batch
+        finally:
+            self._batch = None
+        if pending:
+            self.set_fields(**pending)
 
     def execute(self, object_method, arguments):
         return self.client().execute(self.uuid, object_method.name(), arguments)
 
     def methods(self):
-        return self._method_list
+        return [
+            getattr(self, method.static_name()) for method in self.__class__._methods
+        ]
 
     def to_string(self):
-        return json.dumps(self.to_dict())
+        return codec.dumps(self.to_dict())
 
     def raise_write_exception(self, property_name):
         raise AttributeError("Property " + property_name + " is read only!")
 
 
+class Object(ObjectBase):
+    pass
+
+
+_MISSING = object()
+
+
+class CompactObject(ObjectBase):
+    # Memory efficient local objects for holding large snapshots. Instances have
+    # no __dict__. Field values are kept in a tuple, indexed through a field table
+    # shared by all instances of the class, and child objects are compact too.
+    # Numeric arrays are stored as NumPy arrays if the client uses them.
+    __slots__ = ("_values", "_client")
+
+    _local = True
+
+    def __init__(self, json_object="", client=None, local=True):
+        if not isinstance(json_object, dict):
+            json_object = codec.loads(json_object)
+        object.__setattr__(self, "_client", client)
+        object.__setattr__(self, "_values", self._pack(json_object))
+
+    @classmethod
+    def _pack(cls, json_object):
+        field_index = cls._field_index
+        if any(key not in field_index for key in json_object):
+            cls._add_fields(json_object)
+        values = [_MISSING] * len(cls._field_names)
+        for key, value in json_object.items():
+            values[field_index[key]] = value
+        return tuple(values)
+
+    @classmethod
+    def _add_fields(cls, field_keywords):
+        # Fields are only ever appended, so existing instances stay valid
+        with _class_registry_lock:
+            for field_keyword in field_keywords:
+                if field_keyword not in cls._field_index:
+                    cls._field_index[field_keyword] = len(cls._field_names)
+                    cls._field_names.append(field_keyword)
+
+    @property
+    def _fields(self):
+        return {
+            key: value
+            for key, value in zip(self._field_names, self._values)
+            if value is not _MISSING
+        }
+
+    @property
+    def keyword(self):
+        return self._values[self._field_index["keyword"]]
+
+    def get(self, field_keyword):
+        index = self._field_index.get(field_keyword)
+        if index is None or index >= len(self._values):
+            return None
+        value = self._values[index]
+        if value is _MISSING:
+            return None
+        if isinstance(value, list):
+            return self._wrap_value(value, field_keyword)
+        return value
+
+    def get_many(self, field_keywords):
+        return {
+            field_keyword: self.get(field_keyword) for field_keyword in field_keywords
+        }
+
+    def set(self, field_keyword, value):
+        if isinstance(value, Object):
+            value = compact_object(self._client, value.to_json())
+        elif not isinstance(value, CompactObject):
+            value = arrays.to_json_value(value)
+        if field_keyword not in self._field_index:
+            self._add_fields([field_keyword])
+
+        values = list(self._values)
+        values.extend([_MISSING] * (len(self._field_names) - len(values)))
+        values[self._field_index[field_keyword]] = value
+        object.__setattr__(self, "_values", tuple(values))
+
+    def create_field(self, keyword, type, value):
+        self.set(keyword, {"type": type, "value": value})
+
+    def set_fields(self, **kwargs):
+        for key, value in kwargs.items():
+            self.set(key, value)
+
+    # Writes to local objects are immediate, so there is nothing to batch
+    @contextlib.contextmanager
+    def batch(self):
+        yield self
+
+    def to_dict(self):
+        return {key: _compact_json_value(value) for key, value in self._fields.items()}
+
+
+def _compact_json_value(value):
+    if isinstance(value, ObjectBase):
+        return value.to_dict()
+    if isinstance(value, list):
+        return [_compact_json_value(item) for item in value]
+    return arrays.to_json_value(value)
+
+
+# Convert a JSON object, or a local object graph as returned by load_tree(), to
+# compact objects. Objects with the same uuid become the same compact object.
+def compact_object(client, json_object, memo=None):
+    if memo is None:
+        memo = {}
+    object_uuid = json_object.get("uuid")
+    if object_uuid is not None and object_uuid in memo:
+        return memo[object_uuid]
+
+    cls = client.object_class(json_object["keyword"], json_object, compact=True)
+    numpy_arrays = getattr(client, "numpy_arrays", False)
+    values = {}
+    for key, value in json_object.items():
+        if isinstance(value, dict) and "keyword" in value:
+            value = compact_object(client, value, memo)
+        elif isinstance(value, list):
+            dtype = cls._array_dtypes.get(key) if numpy_arrays else None
+            if dtype is not None:
+                value = arrays.numpy.asarray(value, dtype=dtype)
+            else:
+                value = [
+                    compact_object(client, item, memo)
+                    if isinstance(item, dict) and "keyword" in item
+                    else item
+                    for item in value
+                ]
+        values[key] = value
+
+    instance = cls(values, client)
+    if object_uuid is not None:
+        memo[object_uuid] = instance
+    return instance
+
+
 def make_read_lambda(property_name):
     return lambda self: self.get(property_name)
 
@@ -157,14 +469,66 @@ def make_error_write_lambda(property_name):
     return lambda self, value: self.raise_write_exception(property_name)
 
 
-def create_class(name, schema_properties):
-    def __init__(self, json_object="", client=None, local=False):
-        Object.__init__(self, json_object, client, local)
+# Generated classes by (schema location, schema hash). Classes are identical for
+# identical schemas, so each one is only built once per process.
+_class_registry = {}
+_class_registry_lock = threading.Lock()
+
+
+def schema_hash(schema_properties):
+    text = json.dumps(schema_properties, sort_keys=True)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
 
-    newclass = type(name, (Object,), {"__init__": __init__})
+
+# Create the class for an object schema. Compact classes derive from CompactObject
+# and can only be used for local objects.
+def create_class(name, schema_properties, schema_location=None, compact=False):
+    key = (schema_location or name, schema_hash(schema_properties), compact)
+    newclass = _class_registry.get(key)
+    if newclass is None:
+        with _class_registry_lock:
+            newclass = _class_registry.get(key)
+            if newclass is None:
+                newclass = _build_class(name, schema_properties, compact)
+                _class_registry[key] = newclass
+    return newclass
+
+
+def _build_class(name, schema_properties, compact=False):
+    if compact:
+        base = CompactObject
+        # The field table starts out with the schema fields, and grows if
+        # objects turn up with other keys
+        field_names = ["keyword", "uuid", "$id"] + [
+            property_name
+            for property_name in schema_properties
+            if property_name not in ("keyword", "uuid", "methods")
+        ]
+        namespace = {
+            "__slots__": (),
+            "_field_names": field_names,
+            "_field_index": {key: index for index, key in enumerate(field_names)},
+        }
+    else:
+        base = Object
+        namespace = {}
+
+        def __init__(self, json_object="", client=None, local=False):
+            Object.__init__(self, json_object, client, local)
+
+        namespace["__init__"] = __init__
+
+    # Each generated class has its own method table
+    namespace["_methods"] = []
+    namespace["_array_dtypes"] = {}
+    newclass = type(name, (base,), namespace)
 
     for property_name, prop in schema_properties.items():
         if property_name != "keyword" and property_name != "methods":
+            dtype = arrays.array_dtype(prop)
+            if dtype is not None:
+                newclass._array_dtypes[property_name] = dtype
+
             read_only = "readOnly" in prop and prop["readOnly"]
             write_only = "writeOnly" in prop and prop["writeOnly"]
 
@@ -187,8 +551,8 @@ def create_class(name, schema_properties):
         elif property_name == "methods":
             for method_name, method_schema in prop["properties"].items():
                 method_schema = method_schema["properties"]
-                newclass._methods.append(
-                    create_method_class(method_name, method_schema)
-                )
+                method_class = create_method_class(method_name, method_schema)
+                newclass._methods.append(method_class)
+                setattr(newclass, method_name, MethodDescriptor(method_class))
     newclass.prep_attributes()
     return newclass
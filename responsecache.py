@@ -0,0 +1,156 @@
+###################################################################################################
+#
+#   Caffa
+#   Copyright (C) Kontur AS
+#
+#   GNU Lesser General Public License Usage
+#   This library is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation; either version 2.1 of the License, or
+#   (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful, but WITHOUT ANY
+#   WARRANTY; without even the implied warranty of MERCHANTABILITY or
+#   FITNESS FOR A PARTICULAR PURPOSE.
+#
+#   See the GNU Lesser General Public License at <<http:#www.gnu.org/licenses/lgpl-2.1.html>>
+#   for more details.
+#
+import threading
+import time
+from collections import OrderedDict
+
+
+class CachedResponse:
+    __slots__ = ("body", "etag", "last_modified", "expires")
+
+    def __init__(self, body, etag, last_modified, expires):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires = expires
+
+    def is_fresh(self):
+        return self.expires is not None and self.expires > time.monotonic()
+
+    # Request headers asking the server to answer 304 if the body is unchanged
+    def validators(self):
+        headers = {}
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+# Bounded LRU cache of GET response bodies with their validators (ETag and
+# Last-Modified). Cached bodies are revalidated with a conditional request and
+# reused if the server answers 304 Not Modified, or reused without a request
+# while fresh according to Cache-Control max-age. Responses without validators,
+# or marked no-store, are not cached. The least recently used entries are evicted
+# when there are more than max_entries, or the bodies exceed max_bytes in total.
+# A cache may be shared by several clients of the same server.
+#
+# Keys are tuples starting with the server and the request path, followed by
+# anything else the response depends on, so writes can drop every entry for the
+# paths they affect with invalidate_paths().
+class ResponseCache:
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+        self._size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    # The cached response for key, which may need revalidation unless is_fresh()
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if entry.is_fresh():
+                self.hits += 1
+            return entry
+
+    def put(self, key, body, headers):
+        cache_control = _cache_control(headers)
+        if "no-store" in cache_control:
+            return
+        expires = None
+        max_age = cache_control.get("max-age")
+        if max_age is not None and "no-cache" not in cache_control:
+            try:
+                expires = time.monotonic() + int(max_age)
+            except ValueError:
+                pass
+        entry = CachedResponse(
+            body, headers.get("ETag"), headers.get("Last-Modified"), expires
+        )
+        if entry.etag is None and entry.last_modified is None and expires is None:
+            return
+        if len(body) > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous.body)
+            self._entries[key] = entry
+            self._size += len(body)
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.body)
+
+    # The server confirmed the cached body with a 304 response
+    def revalidated(self, key, headers):
+        with self._lock:
+            self.revalidations += 1
+            entry = self._entries.get(key)
+        if entry is None:
+            return
+        max_age = _cache_control(headers).get("max-age")
+        if max_age is not None:
+            try:
+                entry.expires = time.monotonic() + int(max_age)
+            except ValueError:
+                pass
+
+    def invalidate(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._size -= len(entry.body)
+
+    # Drop the entries for server whose paths start with any of path_prefixes
+    def invalidate_paths(self, server, path_prefixes):
+        path_prefixes = tuple(path_prefixes)
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] == server and key[1].startswith(path_prefixes):
+                    self._size -= len(self._entries.pop(key).body)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    @property
+    def size(self):
+        return self._size
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _cache_control(headers):
+    directives = {}
+    for directive in headers.get("Cache-Control", "").split(","):
+        name, _, value = directive.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"') or None
+    return directives
@@ -17,15 +17,27 @@
 #   for more details.
 #
 
-import json
+import contextlib
 import logging
 import requests
 import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from enum import IntEnum
-from types import SimpleNamespace
 
-from . import object
+from . import (
+    arrays,
+    codec,
+    compression,
+    crawler,
+    metrics,
+    object,
+    retry,
+    schemasnapshot,
+    streaming,
+    transports,
+)
+from .fieldcache import FieldCache, FieldCacheObserver
 
 # Update the (x, y, z) tuple to match minimum required version (0, 6, 4) means minimum 0.6.4
 # By default we try to match the caffa-version
@@ -34,6 +46,17 @@ from . import object
 MIN_APP_VERSION = (1, 5, 0)
 MAX_APP_VERSION = (1, 6, 99)
 
+# Transport errors where the request can safely be sent again
+_RETRYABLE_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+# Marks threads belonging to a client executor, so work submitted from inside the
+# pool runs inline instead of waiting on (and possibly starving) the same pool.
+_worker_state = threading.local()
+
+
+def _mark_worker_thread():
+    _worker_state.in_pool = True
+
 
 class SessionType(IntEnum):
     INVALID = 0
@@ -45,6 +68,33 @@ class RestClient:
     number_of_attempts = 1
     delay_between_attempts = 0.5
 
+    # Connection pool sizing for the shared HTTP session. pool_connections is the
+    # number of per-host pools to keep, pool_maxsize the number of kept-alive
+    # connections per host. pool_block makes threads wait for a free connection
+    # instead of opening (and discarding) extra ones when the pool is exhausted.
+    pool_connections = 1
+    pool_maxsize = 10
+    pool_block = False
+
+    # Keepalives are only sent when the session has been idle for a fraction of
+    # the session timeout reported by the server, or for the default interval
+    # (in seconds) if the server does not report one.
+    default_keepalive_interval = 0.5
+    keepalive_fraction = 0.25
+
+    # Set for clients owned by a ClientPool
+    _pool = None
+    _pool_key = None
+
+    # Default (connect, read) timeouts in seconds for every request
+    timeout = (10.0, 300.0)
+
+    # Request bodies smaller than this many bytes are never compressed
+    compression_threshold = 1024
+
+    # Network calls return results, not coroutines. See AsyncRestClient
+    is_async = False
+
     def __init__(
             self,
             hostname,
@@ -54,13 +104,82 @@ class RestClient:
             min_app_version=MIN_APP_VERSION,
             max_app_version=MAX_APP_VERSION,
             session_type=SessionType.REGULAR,
+            pool_connections=None,
+            pool_maxsize=None,
+            preload_schemas=False,
+            field_cache=None,
+            numpy_arrays=False,
+            timeout=None,
+            retry_policy=None,
+            circuit_breaker=None,
+            metrics=None,
+            schema_file=None,
+            response_cache=None,
+            compress_requests=False,
+            transport=None,
     ):
         self.hostname = hostname
         self.port = port
+        # How requests reach the server. See transports
+        self.transport = transport or transports.TcpTransport(hostname, port)
+        self._base_url = self.transport.base_url()
+        self._endpoint = self.transport.endpoint()
+        self.timeout = timeout or RestClient.timeout
+        self.retry_policy = retry_policy or retry.RetryPolicy()
+        self.circuit_breaker = circuit_breaker or retry.circuit_breaker(self._endpoint)
+        # Optional request metrics and tracing. See metrics.Metrics
+        self.metrics = metrics
+        # Optional cache of GET responses, revalidated with conditional requests.
+        # See responsecache.ResponseCache
+        self.response_cache = response_cache
+        # Compress request bodies of at least compression_threshold bytes. Opt-in,
+        # since not every server takes compressed bodies: True compresses with
+        # gzip, or name one of compression.ENCODERS. A server answering 415
+        # turns it off again. See compression.
+        if compress_requests is True:
+            compress_requests = "gzip"
+        if compress_requests and compress_requests not in compression.ENCODERS:
+            raise ValueError("Unsupported request encoding %s" % compress_requests)
+        self.compress_requests = bool(compress_requests)
+        self._request_encoding = compress_requests or None
         self.basic_auth = requests.auth.HTTPBasicAuth(username, password)
+        self._pool_maxsize = pool_maxsize or RestClient.pool_maxsize
+        self.session = self._create_http_session(
+            pool_connections or RestClient.pool_connections, self._pool_maxsize
+        )
 
         self.log = logging.getLogger("rpc-logger")
-        self.mutex = threading.Lock()
+        self._last_request_time = time.monotonic()
+
+        # Schemas and fully resolved schema properties by schema location
+        self._schema_lock = threading.Lock()
+        self._schema_cache = {}
+        self._schema_properties_cache = {}
+        self._class_cache = {}
+        self._app_version = None
+
+        # Whether the server returns full objects from GET /objects/<uuid>.
+        # None until the first bulk read has found out.
+        self._supports_object_get = None
+        self._supports_object_put = None
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+        # Optional client-side cache of field values. See enable_field_cache()
+        self.field_cache = field_cache
+        self._field_cache_observer = None
+
+        # Return numeric array fields as NumPy arrays. The server is asked for raw
+        # binary arrays, and they are sent back in binary once it has provided them.
+        if numpy_arrays:
+            arrays.require_numpy()
+        self.numpy_arrays = numpy_arrays
+        self._binary_arrays = False
+
+        # Kept for checking the version again on reconnect() and session errors
+        self._min_app_version = min_app_version
+        self._max_app_version = max_app_version
+        self._session_type = session_type
 
         version_status = True
         errmsg = ""
@@ -90,22 +209,67 @@ class RestClient:
         if not self.session_uuid:
             raise RuntimeError("Failed to create session")
         self.log.debug("Session uuid: %s", self.session_uuid)
-        self.keep_alive = True
-        self.keepalive_thread = threading.Thread(target=self.send_keepalives)
-        self.keepalive_thread.start()
 
-    def quit(self):
         try:
-            self.mutex.acquire()
-            self.keep_alive = False
-            if self.session_uuid:
+            # A schema file is used if it matches the server version, and is
+            # (re)written from the server schemas otherwise
+            if schema_file is not None:
+                if not self.load_schemas(schema_file):
+                    self._write_schema_file(schema_file)
+            elif preload_schemas:
+                self.preload_schemas()
+
+            self.keepalive_interval = keepalive_interval(
+                self.session_metadata(), RestClient.default_keepalive_interval
+            )
+        except Exception:
+            # Do not leave the new session open on the server
+            with contextlib.suppress(RuntimeError):
                 self._perform_delete_request("/sessions/" + self.session_uuid, "")
-        finally:
-            self.mutex.release()
+            self.session.close()
+            raise
+        self._stop_keepalives = threading.Event()
+        self.keepalive_thread = threading.Thread(
+            target=self.send_keepalives, daemon=True
+        )
+        self.keepalive_thread.start()
+
+    # Get a client from the process-wide pool, reusing an open session for the same
+    # host, port, user and session type if there is one. quit() returns it to the pool.
+    @classmethod
+    def shared(cls, hostname, port=50000, username="", password="", **kwargs):
+        from .clientpool import default_pool
+
+        return default_pool.acquire(hostname, port, username, password, **kwargs)
+
+    def quit(self):
+        if self._pool is not None:
+            self._pool.release(self)
+            return
+
+        self._stop_keepalives.set()
         self.keepalive_thread.join()
+        if self._field_cache_observer is not None:
+            self._field_cache_observer.close()
+            self._field_cache_observer = None
+        if self.session_uuid:
+            self._perform_delete_request("/sessions/" + self.session_uuid, "")
+        if self._executor is not None:
+            self._executor.shutdown()
+        self.session.close()
+
+    def _create_http_session(self, pool_connections, pool_maxsize):
+        # One session (and connection pool) per client, shared by the keepalive
+        # thread and all user threads. The underlying urllib3 pools are thread safe.
+        session = requests.Session()
+        session.auth = self.basic_auth
+        self.transport.mount(
+            session, pool_connections, pool_maxsize, RestClient.pool_block
+        )
+        return session
 
     def _build_url(self, path, params=""):
-        url = "http://" + self.hostname + ":" + str(self.port) + path
+        url = self._base_url + path
         if hasattr(self, "session_uuid"):
             url += "?session_uuid=" + self.session_uuid
             if len(params) > 0:
@@ -115,12 +279,130 @@ class RestClient:
                 url += "?" + params
         return url
 
-    def _perform_get_request(self, path, params=""):
+    def _send_request(self, method, path, params="", **kwargs):
         url = self._build_url(path, params)
+        if "json" in kwargs:
+            kwargs["data"] = codec.dumps_bytes(kwargs.pop("json"))
+            kwargs["headers"] = {
+                "Content-Type": codec.CONTENT_TYPE,
+                **kwargs.get("headers", {}),
+            }
+        kwargs.setdefault("timeout", self.timeout)
+        uncompressed = None
+        if self._request_encoding is not None:
+            uncompressed = self._compress_body(kwargs)
+
+        attempt = 0
+        while True:
+            self.circuit_breaker.before_request()
+            if self.metrics is not None:
+                start_time = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                if self.metrics is not None:
+                    self._record_request(method, path, None, start_time, kwargs)
+                self.circuit_breaker.record_failure()
+                retryable = isinstance(e, _RETRYABLE_ERRORS)
+                if not retryable or not self.retry_policy.should_retry(method, attempt):
+                    raise
+                self.log.debug("%s %s failed (%s). Retrying", method, path, e)
+            else:
+                self._last_request_time = time.monotonic()
+                if self.metrics is not None:
+                    self._record_request(method, path, response, start_time, kwargs)
+                if response.status_code == 415 and uncompressed is not None:
+                    # The server does not take compressed bodies after all
+                    self.log.info("Server rejected compressed request. Disabling")
+                    self.compress_requests = False
+                    self._request_encoding = None
+                    kwargs["data"] = uncompressed
+                    del kwargs["headers"]["Content-Encoding"]
+                    uncompressed = None
+                    response.close()
+                    continue
+                if response.status_code not in self.retry_policy.retry_statuses:
+                    self.circuit_breaker.record_success()
+                    response.raise_for_status()
+                    if method != "GET" and self.response_cache is not None:
+                        self.response_cache.invalidate_paths(
+                            self._endpoint, _invalidated_paths(path)
+                        )
+                    return response
+
+                self.circuit_breaker.record_failure()
+                if not self.retry_policy.should_retry(method, attempt):
+                    response.raise_for_status()
+                    return response
+                self.log.debug(
+                    "%s %s failed with status %d. Retrying",
+                    method,
+                    path,
+                    response.status_code,
+                )
+                response.close()
+
+            time.sleep(self.retry_policy.backoff(attempt))
+            attempt += 1
+
+    # Compress the request body in kwargs if it is large enough. Returns the
+    # uncompressed body, or None if it was left as is.
+    def _compress_body(self, kwargs):
+        data = kwargs.get("data")
+        if not isinstance(data, bytes) or len(data) < self.compression_threshold:
+            return None
+        kwargs["data"] = compression.compress(data, self._request_encoding)
+        kwargs["headers"] = {
+            **kwargs.get("headers", {}),
+            "Content-Encoding": self._request_encoding,
+        }
+        return data
+
+    def _record_request(self, method, path, response, start_time, kwargs):
+        elapsed = time.perf_counter() - start_time
+        data = kwargs.get("data")
+        bytes_sent = len(data) if isinstance(data, (bytes, str)) else 0
+        bytes_received = 0
+        status = None
+        if response is not None:
+            status = response.status_code
+            # Count bytes on the wire, before any decompression
+            content_length = response.headers.get("Content-Length")
+            if content_length is not None:
+                bytes_received = int(content_length)
+            elif not kwargs.get("stream"):
+                bytes_received = len(response.content)
+        self.metrics.record_request(
+            method, path, status, elapsed, bytes_sent, bytes_received
+        )
+
+    def _cached_get_request(self, path, params):
+        # Keyed by server so a cache can be shared by clients of several servers,
+        # and by user since the server may answer differently for each user
+        key = (self._endpoint, path, params, self.basic_auth.username)
+        entry = self.response_cache.get(key)
+        if entry is not None and entry.is_fresh():
+            return entry.body
+
+        headers = entry.validators() if entry is not None else {}
+        response = self._send_request("GET", path, params, headers=headers)
+        if response.status_code == 304 and entry is not None:
+            self.response_cache.revalidated(key, response.headers)
+            return entry.body
+        self.response_cache.put(key, response.content, response.headers)
+        return response.content
+
+    # A tracing span around an operation, if metrics with a tracer are enabled
+    def _span(self, name, attributes=None):
+        if self.metrics is None:
+            return metrics._NO_SPAN
+        return self.metrics.span(name, attributes)
+
+    def _perform_get_request(self, path, params=""):
         try:
-            response = requests.get(url, auth=self.basic_auth)
-            response.raise_for_status()
-            return response.text
+            if self.response_cache is not None:
+                return self._cached_get_request(path, params)
+            return self._send_request("GET", path, params).content
         except requests.exceptions.HTTPError as e:
             raise RuntimeError(
                 "Failed GET request with error %s" % e.response.text
@@ -129,11 +411,8 @@ class RestClient:
             raise RuntimeError("Failed GET request with error %s" % e) from None
 
     def _perform_options_request(self, path, params=""):
-        url = self._build_url(path, params)
         try:
-            response = requests.options(url, auth=self.basic_auth)
-            response.raise_for_status()
-            return response.text
+            return self._send_request("OPTIONS", path, params).content
         except requests.exceptions.HTTPError as e:
             raise RuntimeError(
                 "Failed OPTIONS request with error %s" % e.response.text
@@ -142,11 +421,8 @@ class RestClient:
             raise RuntimeError("Failed OPTIONS request with error %s" % e) from None
 
     def _perform_delete_request(self, path, params):
-        url = self._build_url(path, params)
         try:
-            response = requests.delete(url, auth=self.basic_auth)
-            response.raise_for_status()
-            return response.text
+            return self._send_request("DELETE", path, params).content
         except requests.exceptions.HTTPError as e:
             raise RuntimeError(
                 "Failed DELETE request with error %s" % e.response.text
@@ -155,11 +431,8 @@ class RestClient:
             raise RuntimeError("Failed DELETE request with error %s" % e) from None
 
     def _perform_put_request(self, path, params="", body=""):
-        url = self._build_url(path, params)
         try:
-            response = requests.put(url, json=body, auth=self.basic_auth)
-            response.raise_for_status()
-            return response.text
+            return self._send_request("PUT", path, params, json=body).content
         except requests.exceptions.HTTPError as e:
             raise RuntimeError(
                 "Failed PUT request with error %s" % e.response.text
@@ -168,11 +441,8 @@ class RestClient:
             raise RuntimeError("Failed PUT request with error %s" % e) from None
 
     def _perform_post_request(self, path, params="", body=""):
-        url = self._build_url(path, params)
         try:
-            response = requests.post(url, json=body, auth=self.basic_auth)
-            response.raise_for_status()
-            return response.text
+            return self._send_request("POST", path, params, json=body).content
         except requests.exceptions.HTTPError as e:
             self.log.error("Failed POST request with error " + e.response.text)
             raise e
@@ -181,20 +451,32 @@ class RestClient:
             raise e
 
     def _json_text_to_object(self, text):
-        return json.loads(text, object_hook=lambda d: SimpleNamespace(**d))
-
-    def create_local_object(self, keyword, json_object):
-        schema_location = ""
-        if "$id" in json_object:
-            schema_location = json_object["$id"]
-        else:
-            schema_location = self.schema_location_from_keyword(keyword)
+        return json_text_to_object(text)
 
-        schema_properties = self.schema_properties(schema_location)
-        cls = object.create_class(keyword, schema_properties)
+    # Create a local object from JSON. Compact objects use far less memory, which
+    # matters for large snapshots, but cannot be used as remote objects.
+    def create_local_object(self, keyword, json_object, compact=False):
+        if compact:
+            return object.compact_object(self, json_object)
+        cls = self.object_class(keyword, json_object)
         local_object = cls(json_object, self, True)
         return local_object
 
+    def object_schema_location(self, keyword, json_object=None):
+        return object_schema_location(self.schema_root(), keyword, json_object)
+
+    def object_class(self, keyword, json_object=None, compact=False):
+        schema_location = self.object_schema_location(keyword, json_object)
+        cls = self._class_cache.get((schema_location, compact))
+        if cls is None:
+            schema_properties = self.schema_properties(schema_location)
+            cls = object.create_class(
+                keyword, schema_properties, schema_location, compact
+            )
+            with self._schema_lock:
+                self._class_cache[(schema_location, compact)] = cls
+        return cls
+
     def schema_root(self):
         return "/openapi.json"
 
@@ -202,46 +484,144 @@ class RestClient:
         return self.schema(self.schema_root() + "/components/object_schemas")
 
     def schema(self, location):
-        if location.startswith("#"):
-            location = self.schema_root() + location[1:]
-        schema = json.loads(self._perform_get_request(location))
+        location = self._full_schema_location(location)
+        schema = self._schema_cache.get(location)
+        if schema is None:
+            schema = codec.loads(self._perform_get_request(location))
+            with self._schema_lock:
+                self._schema_cache[location] = schema
         return schema
 
+    def _full_schema_location(self, location):
+        return full_schema_location(self.schema_root(), location)
+
     def schema_location_from_keyword(self, keyword):
-        return self.schema_root() + "/components/object_schemas/" + keyword
+        return schema_location_from_keyword(self.schema_root(), keyword)
 
     def schema_properties(self, full_schema_location):
-        properties = {}
-        full_schema = self.schema(full_schema_location)
-        if "allOf" in full_schema:
-            for sub_schema in full_schema["allOf"]:
-                if "properties" in sub_schema:
-                    properties = properties | sub_schema["properties"]
-                elif "$ref" in sub_schema:
-                    properties = properties | self.schema_properties(sub_schema["$ref"])
+        full_schema_location = self._full_schema_location(full_schema_location)
+        properties = self._schema_properties_cache.get(full_schema_location)
+        if properties is not None:
+            if self.metrics is not None:
+                self.metrics.record_schema_lookup(True)
+            return properties
+
+        start_time = time.perf_counter()
+        with self._span(
+                "caffa.schema_properties", {"caffa.schema": full_schema_location}
+        ):
+            full_schema = self.schema(full_schema_location)
+            references_start_time = time.perf_counter()
+            referenced_properties = {
+                location: self.schema_properties(location)
+                for location in schema_references(full_schema)
+            }
+            # Referenced schemas record their own resolution time
+            references_time = time.perf_counter() - references_start_time
+            properties = merge_schema_properties(full_schema, referenced_properties)
+
+        with self._schema_lock:
+            self._schema_properties_cache[full_schema_location] = properties
+        if self.metrics is not None:
+            elapsed = time.perf_counter() - start_time - references_time
+            self.metrics.record_schema_lookup(False, elapsed)
         return properties
 
+    # Fetch all object schemas in one request and store them in the schema cache
+    def preload_schemas(self):
+        schemas = self.schema_list()
+        with self._schema_lock:
+            for keyword, schema in schemas.items():
+                self._schema_cache[self.schema_location_from_keyword(keyword)] = schema
+
+    # Write all resolved object schemas for the current server version to a file.
+    # See schemasnapshot.
+    def export_schemas(self, path):
+        self.preload_schemas()
+        for keyword in self.schema_list():
+            self.schema_properties(self.schema_location_from_keyword(keyword))
+
+        # The schema list repeats all the object schemas, so leave it out
+        list_location = self.schema_root() + "/components/object_schemas"
+        with self._schema_lock:
+            schemas = {
+                location: schema
+                for location, schema in self._schema_cache.items()
+                if location != list_location
+            }
+            schema_properties = dict(self._schema_properties_cache)
+        schemasnapshot.save(path, self._app_version, schemas, schema_properties)
+
+    # The schema file only saves work on the next connection, so failing to
+    # write it is not an error
+    def _write_schema_file(self, path):
+        try:
+            self.export_schemas(path)
+        except OSError as e:
+            self.log.warning("Failed to write schema file %s: %s", path, e)
+
+    # Fill the schema cache from a file written by export_schemas(). Returns False
+    # if the file is missing, unreadable or made for another server version.
+    def load_schemas(self, path):
+        snapshot = schemasnapshot.load(path, self._app_version)
+        if snapshot is None:
+            return False
+        schemas, schema_properties = snapshot
+        with self._schema_lock:
+            self._schema_cache.update(schemas)
+            self._schema_properties_cache.update(schema_properties)
+        return True
+
+    def clear_schema_cache(self):
+        with self._schema_lock:
+            self._schema_cache.clear()
+            self._schema_properties_cache.clear()
+            self._class_cache.clear()
+
     def execute(self, object_uuid, method_name, arguments):
-        value = json.loads(
-            self._perform_post_request(
-                path="/objects/" + object_uuid + "/methods/" + method_name,
-                body=arguments,
-            )
-        )
+        with self._span(
+                "caffa.execute",
+                {"caffa.object_uuid": object_uuid, "caffa.method": method_name},
+        ):
+            try:
+                value = codec.loads(
+                    self._perform_post_request(
+                        path="/objects/" + object_uuid + "/methods/" + method_name,
+                        body=arguments,
+                    )
+                )
+            finally:
+                # Methods may change any field of any object
+                if self.field_cache is not None:
+                    self.field_cache.clear()
 
-        if isinstance(value, dict) and value:
-            if "keyword" in value:
-                schema_location = ""
-                keyword = value["keyword"]
-                if "$id" in value:
-                    schema_location = value["$id"]
-                else:
-                    schema_location = self.schema_location_from_keyword(keyword)
-                schema_properties = self.schema_properties(schema_location)
-                cls = object.create_class(keyword, schema_properties)
-                return cls(value, self, True)
+            if isinstance(value, dict) and value:
+                if "keyword" in value:
+                    cls = self.object_class(value["keyword"], value)
+                    return cls(value, self, True)
+
+            return value
+
+    # Execute many method calls concurrently over the connection pool. Each call is
+    # a tuple (object, method, arguments), where method is a method name or Method,
+    # and arguments is a dict of labelled arguments, a sequence of positional
+    # arguments or None. Results are returned in the order of the calls. If any
+    # call fails the first error is raised once all calls have finished, unless
+    # return_exceptions is True in which case errors are returned in place of results.
+    def execute_many(self, calls, return_exceptions=False):
+        futures = [self.submit(_call_method, *call) for call in calls]
+        wait(futures)
 
-        return value
+        results = []
+        for future in futures:
+            error = future.exception()
+            if error is None:
+                results.append(future.result())
+            elif return_exceptions:
+                results.append(error)
+            else:
+                raise error
+        return results
 
     def app_info(self):
         return self._json_text_to_object(self._perform_get_request("/app/info"))
@@ -261,102 +641,555 @@ class RestClient:
     def send_keepalive(self):
         self._perform_put_request(path="/sessions/" + self.session_uuid)
 
+    # Open a new session, for instance after the server has restarted. The server
+    # version is checked again first, which drops the cached schemas if it changed.
+    def reconnect(self):
+        version_status, errmsg = self.check_version(
+            self._min_app_version, self._max_app_version
+        )
+        if not version_status:
+            raise RuntimeError(errmsg)
+
+        old_session_uuid = self.session_uuid
+        session_uuid = self.create_session(self._session_type)
+        if not session_uuid:
+            raise RuntimeError("Failed to create session")
+        self.session_uuid = session_uuid
+        self.log.debug("New session uuid: %s", self.session_uuid)
+        if self.field_cache is not None:
+            self.field_cache.clear()
+        try:
+            self._perform_delete_request("/sessions/" + old_session_uuid, "")
+        except RuntimeError as e:
+            self.log.debug("Failed to close the old session: %s", e)
+
+    # A failing session may mean that the server has restarted, possibly with
+    # another version and other schemas
+    def _recheck_version(self):
+        try:
+            self.check_version(self._min_app_version, self._max_app_version)
+        except RuntimeError as e:
+            self.log.debug("Failed to check the server version: %s", e)
+
     def send_keepalives(self):
         while True:
-            time.sleep(0.5)
-            try:
-                self.mutex.acquire()
-                if not self.keep_alive:
-                    break
-                else:
+            wait_time = self.keepalive_interval - (
+                    time.monotonic() - self._last_request_time
+            )
+            if wait_time <= 0:
+                try:
                     self.send_keepalive()
-            finally:
-                self.mutex.release()
+                except RuntimeError as e:
+                    self.log.warning("Failed to send keepalive: %s", e)
+                    self._recheck_version()
+                wait_time = self.keepalive_interval
+            if self._stop_keepalives.wait(wait_time):
+                break
 
     def document(self, document_id):
         assert len(document_id) > 0
-        json_text = self._perform_get_request(
-            "/documents/" + document_id, "skeleton=true"
+        with self._span("caffa.document", {"caffa.document_id": document_id}):
+            json_object = self.document_skeleton(document_id)
+            cls = self.object_class(json_object["keyword"], json_object)
+
+            return cls(json_object, self, False)
+
+    # The document as returned by the server, with child objects only identified
+    # by their keys and schema locations
+    def document_skeleton(self, document_id):
+        return codec.loads(
+            self._perform_get_request("/documents/" + document_id, "skeleton=true")
         )
-        json_object = json.loads(json_text)
-        keyword = json_object["keyword"]
 
-        schema_location = ""
-        if "$id" in json_object:
-            schema_location = json_object["$id"]
-        else:
-            schema_location = self.schema_location_from_keyword(keyword)
+    def _get_executor(self):
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = self.create_executor(self._pool_maxsize)
+        return self._executor
 
-        schema_properties = self.schema_properties(schema_location)
-        cls = object.create_class(keyword, schema_properties)
+    # A new thread pool for a batch of work with its own concurrency limit. The
+    # caller shuts it down. Calls to submit() from its threads run inline.
+    def create_executor(self, max_workers):
+        return ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="caffa-client",
+            initializer=_mark_worker_thread,
+        )
 
-        return cls(json_text, self, False)
+    # Run function on the client thread pool and return a Future. Calls made from
+    # inside the pool run inline and return a completed Future.
+    def submit(self, function, *args, **kwargs):
+        if not getattr(_worker_state, "in_pool", False):
+            return self._get_executor().submit(function, *args, **kwargs)
+
+        future = Future()
+        try:
+            future.set_result(function(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    # Apply function to items on the client thread pool, returning the results in
+    # order. Runs inline for a single item or when called from the pool.
+    def map_concurrently(self, function, items):
+        if len(items) < 2 or getattr(_worker_state, "in_pool", False):
+            return [function(item) for item in items]
+        return list(self._get_executor().map(function, items))
+
+    def get_field_values(self, object_uuid, field_names):
+        values = {}
+        if self.field_cache is not None:
+            for field_name in field_names:
+                json_text = self.field_cache.get(object_uuid, field_name)
+                if json_text is not None:
+                    values[field_name] = codec.loads(json_text)
+            field_names = [name for name in field_names if name not in values]
+            if not field_names:
+                return values
+
+        fetched_values, _ = self._read_field_values(object_uuid, field_names)
+        values.update(fetched_values)
+        return values
+
+    # Read fields like get_field_values(), but skip the transfer if the object is
+    # unchanged since the read that returned etag. Returns (values, etag), where
+    # values is None if the object is unchanged, and etag is None if the server
+    # does not provide entity tags.
+    def get_changed_field_values(self, object_uuid, field_names, etag=None):
+        return self._read_field_values(object_uuid, field_names, etag)
+
+    # Read the fields from the server with a whole-object GET, falling back to
+    # reading them one by one. Returns (values, etag) as get_changed_field_values()
+    def _read_field_values(self, object_uuid, field_names, etag=None):
+        values = {}
+        new_etag = None
+        object_get_failed = False
+        if self._supports_object_get is not False:
+            field_cache = self.field_cache
+            if field_cache is not None:
+                generation = field_cache.generation
+            headers = {"If-None-Match": etag} if etag else {}
+            try:
+                response = self._send_request(
+                    "GET", "/objects/" + object_uuid, headers=headers
+                )
+            except requests.exceptions.HTTPError as e:
+                if e.response.status_code not in (404, 405, 501):
+                    raise RuntimeError(
+                        "Failed GET request with error %s" % e.response.text
+                    ) from None
+                object_get_failed = True
+            except requests.exceptions.RequestException as e:
+                raise RuntimeError("Failed GET request with error %s" % e) from None
+            else:
+                self._supports_object_get = True
+                if response.status_code == 304:
+                    return None, etag
+                json_object = codec.loads(response.content)
+                new_etag = response.headers.get("ETag")
+                for field_name in field_names:
+                    if field_name in json_object:
+                        values[field_name] = json_object[field_name]
+                # The other fields are just as fresh, so cache them all
+                if field_cache is not None:
+                    for field_name, value in json_object.items():
+                        json_text = codec.dumps_bytes(value)
+                        field_cache.put(object_uuid, field_name, json_text, generation)
+
+        missing_names = [name for name in field_names if name not in values]
+        fetched_values = self.map_concurrently(
+            lambda name: codec.loads(self.get_field_value(object_uuid, name)),
+            missing_names,
+        )
+        values.update(zip(missing_names, fetched_values))
+
+        # The fields could be read, so the object exists and the whole-object
+        # read failed because the server does not support it.
+        if object_get_failed:
+            self._supports_object_get = False
+        return values, new_etag
+
+    # Cache field values on the client. Values expire after ttl seconds if given.
+    # With an observe_interval, a separate observing session checks the cached
+    # objects every observe_interval seconds and drops the fields that have
+    # changed on the server. See fieldcache.FieldCacheObserver.
+    def enable_field_cache(self, max_size=4096, ttl=None, observe_interval=None):
+        self.disable_field_cache()
+        field_cache = FieldCache(max_size, ttl)
+        if observe_interval is not None:
+            observing_client = RestClient(
+                self.hostname,
+                self.port,
+                self.basic_auth.username,
+                self.basic_auth.password,
+                session_type=SessionType.OBSERVING,
+                timeout=self.timeout,
+                retry_policy=self.retry_policy,
+                circuit_breaker=self.circuit_breaker,
+                transport=self.transport,
+            )
+            self._field_cache_observer = FieldCacheObserver(
+                observing_client, field_cache, observe_interval
+            )
+        self.field_cache = field_cache
+        return field_cache
+
+    def disable_field_cache(self):
+        self.field_cache = None
+        if self._field_cache_observer is not None:
+            self._field_cache_observer.close()
+            self._field_cache_observer = None
+
+    # Load a whole document as a local object graph. See crawler.load_tree()
+    def load_tree(
+            self,
+            document_id,
+            depth=None,
+            fields=None,
+            max_concurrency=8,
+            compact=False,
+    ):
+        return crawler.load_tree(
+            self, document_id, depth, fields, max_concurrency, compact
+        )
 
     def get_field_value(self, object_uuid, field_name):
-        return self._perform_get_request(
+        field_cache = self.field_cache
+        if field_cache is not None:
+            json_text = field_cache.get(object_uuid, field_name)
+            if json_text is not None:
+                return json_text
+            generation = field_cache.generation
+
+        json_text = self._perform_get_request(
             "/objects/" + object_uuid + "/fields/" + field_name
         )
+        if field_cache is not None:
+            field_cache.put(object_uuid, field_name, json_text, generation)
+        return json_text
+
+    def get_field_array(self, object_uuid, field_name, dtype):
+        # Arrays are cached as JSON, like values read with get_field_value()
+        field_cache = self.field_cache
+        if field_cache is not None:
+            json_text = field_cache.get(object_uuid, field_name)
+            if json_text is not None:
+                return arrays.parse_json_array(json_text.decode("utf-8"), dtype)
+            generation = field_cache.generation
+
+        try:
+            response = self._send_request(
+                "GET",
+                "/objects/" + object_uuid + "/fields/" + field_name,
+                headers={"Accept": arrays.ACCEPT_ARRAY},
+                stream=True,
+            )
+            with response:
+                content_type = response.headers.get("Content-Type", "")
+                if content_type.startswith(arrays.BINARY_CONTENT_TYPE):
+                    self._binary_arrays = True
+                    array = arrays.read_binary_array(response, dtype)
+                    json_text = None
+                else:
+                    json_text = response.content
+                    array = arrays.parse_json_array(json_text.decode("utf-8"), dtype)
+        except requests.exceptions.HTTPError as e:
+            raise RuntimeError(
+                "Failed GET request with error %s" % e.response.text
+            ) from None
+        except requests.exceptions.RequestException as e:
+            raise RuntimeError("Failed GET request with error %s" % e) from None
+
+        if field_cache is not None:
+            if json_text is None:
+                json_text = codec.dumps_bytes(arrays.to_json_value(array))
+            field_cache.put(object_uuid, field_name, json_text, generation)
+        return array
+
+    # Parse an array valued field incrementally while it is downloaded,
+    # yielding one element at a time
+    def iter_field_value(self, object_uuid, field_name, chunk_size=65536):
+        return self._iter_json_array(
+            "GET",
+            "/objects/" + object_uuid + "/fields/" + field_name,
+            chunk_size=chunk_size,
+        )
 
-    def set_field_value(self, object_uuid, field_name, json_value):
-        return self._perform_put_request(
-            path="/objects/" + object_uuid + "/fields/" + field_name, body=json_value
+    # Execute a method returning an array and parse the result while it is downloaded
+    def iter_method_result(self, object_uuid, method_name, arguments, chunk_size=65536):
+        if self.field_cache is not None:
+            self.field_cache.clear()
+        return self._iter_json_array(
+            "POST",
+            "/objects/" + object_uuid + "/methods/" + method_name,
+            chunk_size=chunk_size,
+            json=arguments,
         )
 
+    # Write a field value to a binary file object as received, or into a
+    # preallocated NumPy array (which may be memory mapped). Returns the number of
+    # bytes written to the file or elements written to the array.
+    def download_field_value(self, object_uuid, field_name, target, chunk_size=65536):
+        path = "/objects/" + object_uuid + "/fields/" + field_name
+        if not arrays.is_array(target):
+            with self._stream_request("GET", path) as response:
+                size = 0
+                for chunk in response.iter_content(chunk_size):
+                    target.write(chunk)
+                    size += len(chunk)
+                return size
+
+        with self._stream_request(
+                "GET", path, headers={"Accept": arrays.ACCEPT_ARRAY}
+        ) as response:
+            content_type = response.headers.get("Content-Type", "")
+            if content_type.startswith(arrays.BINARY_CONTENT_TYPE):
+                self._binary_arrays = True
+                buffer = memoryview(target).cast("B")
+                offset = 0
+                for chunk in response.iter_content(chunk_size):
+                    if offset + len(chunk) > len(buffer):
+                        raise ValueError("Target array is too small for the field")
+                    buffer[offset: offset + len(chunk)] = chunk
+                    offset += len(chunk)
+                return offset // target.itemsize
+
+            elements = streaming.iter_json_array(response.iter_content(chunk_size))
+            return streaming.fill_array(
+                target, streaming.iter_batches(elements, chunk_size, target.dtype)
+            )
+
+    def _iter_json_array(self, method, path, chunk_size, **kwargs):
+        with self._stream_request(method, path, **kwargs) as response:
+            yield from streaming.iter_json_array(response.iter_content(chunk_size))
+
+    @contextlib.contextmanager
+    def _stream_request(self, method, path, params="", **kwargs):
+        try:
+            response = self._send_request(method, path, params, stream=True, **kwargs)
+        except requests.exceptions.HTTPError as e:
+            raise RuntimeError(
+                "Failed %s request with error %s" % (method, e.response.text)
+            ) from None
+        except requests.exceptions.RequestException as e:
+            raise RuntimeError(
+                "Failed %s request with error %s" % (method, e)
+            ) from None
+
+        with response:
+            try:
+                yield response
+            except requests.exceptions.RequestException as e:
+                raise RuntimeError(
+                    "Failed %s request with error %s" % (method, e)
+                ) from None
+
+    # NumPy arrays are sent in binary to servers that provide binary arrays if
+    # dtype, the data type of the field from its schema, is given. Otherwise
+    # they are sent as JSON.
+    def set_field_value(self, object_uuid, field_name, json_value, dtype=None):
+        path = "/objects/" + object_uuid + "/fields/" + field_name
+        try:
+            if arrays.is_array(json_value):
+                if self._binary_arrays and dtype is not None:
+                    return self._send_request(
+                        "PUT",
+                        path,
+                        data=arrays.to_binary(json_value, dtype),
+                        headers={"Content-Type": arrays.BINARY_CONTENT_TYPE},
+                    ).content
+                json_value = json_value.tolist()
+            return self._perform_put_request(path=path, body=json_value)
+        except requests.exceptions.HTTPError as e:
+            raise RuntimeError(
+                "Failed PUT request with error %s" % e.response.text
+            ) from None
+        except requests.exceptions.RequestException as e:
+            raise RuntimeError("Failed PUT request with error %s" % e) from None
+        finally:
+            if self.field_cache is not None:
+                self.field_cache.invalidate(object_uuid, field_name)
+
+    def set_field_values(self, object_uuid, values):
+        object_put_failed = False
+        if self._supports_object_put is not False:
+            json_values = {
+                key: arrays.to_json_value(value) for key, value in values.items()
+            }
+            try:
+                self._send_request("PUT", "/objects/" + object_uuid, json=json_values)
+            except requests.exceptions.HTTPError as e:
+                if e.response.status_code not in (404, 405, 501):
+                    raise RuntimeError(
+                        "Failed PUT request with error %s" % e.response.text
+                    ) from None
+                object_put_failed = True
+            except requests.exceptions.RequestException as e:
+                raise RuntimeError("Failed PUT request with error %s" % e) from None
+            else:
+                self._supports_object_put = True
+                return
+            finally:
+                if self.field_cache is not None:
+                    for field_name in values:
+                        self.field_cache.invalidate(object_uuid, field_name)
+
+        # No batch endpoint: write the fields in order over the pooled session
+        for field_name, json_value in values.items():
+            self.set_field_value(object_uuid, field_name, json_value)
+
+        if object_put_failed:
+            self._supports_object_put = False
+
     def check_version(self, min_app_version, max_app_version):
         app_info = self.app_info()
-        self.log.info(
-            "Found Caffa '"
-            + app_info.name
-            + "' with version: "
-            + str(app_info.major_version)
-            + "."
-            + str(app_info.minor_version)
-            + "."
-            + str(app_info.patch_version)
-        )
-        self.log.debug(
-            "Requiring minimum %d.%d.%d",
-            min_app_version[0],
-            min_app_version[1],
-            min_app_version[2],
+        app_version = (
+            app_info.name,
+            app_info.major_version,
+            app_info.minor_version,
+            app_info.patch_version,
         )
-        self.log.debug(
-            "Requiring maximum %d.%d.%d",
-            max_app_version[0],
-            max_app_version[1],
-            max_app_version[2],
+        if self._app_version is not None and self._app_version != app_version:
+            self.log.info("Server version changed. Clearing schema cache")
+            self.clear_schema_cache()
+        self._app_version = app_version
+
+        return compare_app_version(
+            self.log, app_info, min_app_version, max_app_version
         )
-        if (
+
+
+# The interval between keepalives for an idle session, based on the session timeout
+# (in milliseconds) from the session metadata if the server provides one.
+def keepalive_interval(session_metadata, default_interval):
+    timeout = getattr(session_metadata, "timeout", None)
+    if not timeout:
+        return default_interval
+    return max(default_interval, timeout / 1000.0 * RestClient.keepalive_fraction)
+
+
+def _call_method(self_object, method, arguments=None):
+    if isinstance(method, str):
+        method = getattr(self_object, method)
+    elif isinstance(method, type):
+        method = getattr(self_object, method.static_name())
+
+    if isinstance(arguments, dict):
+        return method(**arguments)
+    if arguments is None:
+        return method()
+    return method(*arguments)
+
+
+# The path prefixes of the cached responses a successful write to path may have
+# changed. Objects are included in the fields of their parents and in documents,
+# and methods may change any object, so a write to an object, one of its fields
+# or a method call drops every cached object and document. Other writes, such as
+# to sessions, leave the cached schemas and app info alone.
+def _invalidated_paths(path):
+    if path.startswith("/objects/"):
+        return ("/objects/", "/documents/")
+    return ()
+
+
+# The full location of the schema of an object, from its $id if it has one and
+# from its keyword otherwise
+def object_schema_location(schema_root, keyword, json_object=None):
+    if json_object is not None and "$id" in json_object:
+        return full_schema_location(schema_root, json_object["$id"])
+    return schema_location_from_keyword(schema_root, keyword)
+
+
+def full_schema_location(schema_root, location):
+    if location.startswith("#"):
+        location = schema_root + location[1:]
+    return location
+
+
+def schema_location_from_keyword(schema_root, keyword):
+    return schema_root + "/components/object_schemas/" + keyword
+
+
+# The locations of the schemas a schema refers to in its allOf list
+def schema_references(full_schema):
+    return [
+        sub_schema["$ref"]
+        for sub_schema in full_schema.get("allOf", ())
+        if "properties" not in sub_schema and "$ref" in sub_schema
+    ]
+
+
+# Merge the properties of all parts of a schema, given the properties of the
+# schemas it refers to by location
+def merge_schema_properties(full_schema, referenced_properties):
+    properties = {}
+    for sub_schema in full_schema.get("allOf", ()):
+        if "properties" in sub_schema:
+            properties = properties | sub_schema["properties"]
+        elif "$ref" in sub_schema:
+            properties = properties | referenced_properties[sub_schema["$ref"]]
+    return properties
+
+
+def json_text_to_object(text):
+    return codec.loads_namespace(text)
+
+
+def compare_app_version(log, app_info, min_app_version, max_app_version):
+    log.info(
+        "Found Caffa '"
+        + app_info.name
+        + "' with version: "
+        + str(app_info.major_version)
+        + "."
+        + str(app_info.minor_version)
+        + "."
+        + str(app_info.patch_version)
+    )
+    log.debug(
+        "Requiring minimum %d.%d.%d",
+        min_app_version[0],
+        min_app_version[1],
+        min_app_version[2],
+    )
+    log.debug(
+        "Requiring maximum %d.%d.%d",
+        max_app_version[0],
+        max_app_version[1],
+        max_app_version[2],
+    )
+    if (
+            app_info.major_version,
+            app_info.minor_version,
+            app_info.patch_version,
+    ) < min_app_version:
+        return (
+            False,
+            "App Version v{}.{}.{} is too old. This client only supports version v{}.{}.{} and newer".format(
                 app_info.major_version,
                 app_info.minor_version,
                 app_info.patch_version,
-        ) < min_app_version:
-            return (
-                False,
-                "App Version v{}.{}.{} is too old. This client only supports version v{}.{}.{} and newer".format(
-                    app_info.major_version,
-                    app_info.minor_version,
-                    app_info.patch_version,
-                    min_app_version[0],
-                    min_app_version[1],
-                    min_app_version[2],
-                ),
-            )
-        if (
+                min_app_version[0],
+                min_app_version[1],
+                min_app_version[2],
+            ),
+        )
+    if (
+            app_info.major_version,
+            app_info.minor_version,
+            app_info.patch_version,
+    ) > max_app_version:
+        return (
+            False,
+            "App Version v{}.{}.{} is too new. This client only supports up to and including v{}.{}.{}".format(
                 app_info.major_version,
                 app_info.minor_version,
                 app_info.patch_version,
-        ) > max_app_version:
-            return (
-                False,
-                "App Version v{}.{}.{} is too new. This client only supports up to and including v{}.{}.{}".format(
-                    app_info.major_version,
-                    app_info.minor_version,
-                    app_info.patch_version,
-                    max_app_version[0],
-                    max_app_version[1],
-                    max_app_version[2],
-                ),
-            )
+                max_app_version[0],
+                max_app_version[1],
+                max_app_version[2],
+            ),
+        )
 
-        return True, ""
+    return True, ""
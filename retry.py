@@ -0,0 +1,114 @@
+###################################################################################################
+#
+#   Caffa
+#   Copyright (C) Kontur AS
+#
+#   GNU Lesser General Public License Usage
+#   This library is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation; either version 2.1 of the License, or
+#   (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful, but WITHOUT ANY
+#   WARRANTY; without even the implied warranty of MERCHANTABILITY or
+#   FITNESS FOR A PARTICULAR PURPOSE.
+#
+#   See the GNU Lesser General Public License at <<http:#www.gnu.org/licenses/lgpl-2.1.html>>
+#   for more details.
+#
+import random
+import threading
+import time
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class RetryPolicy:
+    # Retries idempotent requests that failed to connect, timed out or got one of
+    # retry_statuses back. The delay before retry n (counting from 0) is drawn
+    # uniformly from [0, min(max_backoff, backoff_factor * 2^n)] ("full jitter"),
+    # so clients retrying after a server restart are spread out.
+    idempotent_methods = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+    retry_statuses = frozenset([429, 502, 503, 504])
+
+    def __init__(self, max_attempts=3, backoff_factor=0.2, max_backoff=10.0):
+        self.max_attempts = max_attempts
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+
+    def should_retry(self, method, attempt):
+        return method in self.idempotent_methods and attempt + 1 < self.max_attempts
+
+    def backoff(self, attempt):
+        return random.uniform(
+            0.0, min(self.max_backoff, self.backoff_factor * (2 ** attempt))
+        )
+
+
+# No retries at all
+NO_RETRIES = RetryPolicy(max_attempts=1)
+
+
+class CircuitBreaker:
+    # Stops sending requests to a host after failure_threshold consecutive
+    # failures. After reset_timeout seconds one trial request is let through, and
+    # the circuit closes again if it succeeds.
+    def __init__(self, failure_threshold=5, reset_timeout=10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def before_request(self):
+        if self._opened_at is None:
+            return
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if (
+                    not self._trial_in_progress
+                    and time.monotonic() - self._opened_at >= self.reset_timeout
+            ):
+                self._trial_in_progress = True
+                return
+        raise CircuitOpenError(
+            "Circuit open after %d consecutive failures" % self._failures
+        )
+
+    def record_success(self):
+        if self._failures == 0 and self._opened_at is None:
+            return
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_progress or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._trial_in_progress = False
+
+
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+# The process-wide circuit breaker for a server, shared by all clients talking to
+# it. The server is identified by its transport endpoint. See transports.
+def circuit_breaker(endpoint):
+    with _circuit_breakers_lock:
+        breaker = _circuit_breakers.get(endpoint)
+        if breaker is None:
+            breaker = CircuitBreaker()
+            _circuit_breakers[endpoint] = breaker
+        return breaker
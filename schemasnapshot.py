@@ -0,0 +1,79 @@
+###################################################################################################
+#
+#   Caffa
+#   Copyright (C) Kontur AS
+#
+#   GNU Lesser General Public License Usage
+#   This library is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation; either version 2.1 of the License, or
+#   (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful, but WITHOUT ANY
+#   WARRANTY; without even the implied warranty of MERCHANTABILITY or
+#   FITNESS FOR A PARTICULAR PURPOSE.
+#
+#   See the GNU Lesser General Public License at <<http:#www.gnu.org/licenses/lgpl-2.1.html>>
+#   for more details.
+#
+import logging
+import os
+import tempfile
+
+from . import codec
+
+# Resolved object schemas stored in a local file, so that short-lived clients
+# can skip fetching them from the server at startup. A snapshot is only used by
+# clients connected to the exact application name and version it was made for.
+
+FORMAT_VERSION = 1
+
+_log = logging.getLogger("rpc-logger")
+
+
+def save(path, app_version, schemas, schema_properties):
+    content = codec.dumps_bytes(
+        {
+            "format": FORMAT_VERSION,
+            "app_version": list(app_version),
+            "schemas": schemas,
+            "schema_properties": schema_properties,
+        }
+    )
+    # Write to a temporary file first, so that concurrent readers never see
+    # a partially written snapshot
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temporary_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(content)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+
+# Returns (schemas, schema_properties), or None if there is no usable snapshot
+# for the application version
+def load(path, app_version):
+    try:
+        with open(path, "rb") as file:
+            snapshot = codec.loads(file.read())
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        _log.warning("Failed to read schema snapshot %s: %s", path, e)
+        return None
+
+    if not isinstance(snapshot, dict) or snapshot.get("format") != FORMAT_VERSION:
+        _log.info("Ignoring schema snapshot %s with unknown format", path)
+        return None
+    if snapshot.get("app_version") != list(app_version):
+        _log.info(
+            "Ignoring schema snapshot %s for %s, server is %s",
+            path,
+            snapshot.get("app_version"),
+            list(app_version),
+        )
+        return None
+    return snapshot["schemas"], snapshot["schema_properties"]
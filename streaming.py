@@ -0,0 +1,106 @@
+###################################################################################################
+#
+#   Caffa
+#   Copyright (C) Kontur AS
+#
+#   GNU Lesser General Public License Usage
+#   This library is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation; either version 2.1 of the License, or
+#   (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful, but WITHOUT ANY
+#   WARRANTY; without even the implied warranty of MERCHANTABILITY or
+#   FITNESS FOR A PARTICULAR PURPOSE.
+#
+#   See the GNU Lesser General Public License at <<http:#www.gnu.org/licenses/lgpl-2.1.html>>
+#   for more details.
+#
+import codecs
+import json
+
+from . import arrays
+
+_SEPARATORS = " \t\r\n,"
+
+
+# Incrementally parse a JSON array from an iterable of byte chunks, yielding
+# one element at a time. Only the unparsed tail of the input is kept in memory.
+def iter_json_array(chunks):
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buffer = ""
+    position = 0
+    started = False
+    end_of_input = False
+
+    while True:
+        if not started:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position < len(buffer):
+                if buffer[position] != "[":
+                    raise ValueError("Response is not a JSON array")
+                started = True
+                position += 1
+                continue
+        else:
+            while position < len(buffer) and buffer[position] in _SEPARATORS:
+                position += 1
+            if position < len(buffer):
+                if buffer[position] == "]":
+                    return
+                try:
+                    value, end = decoder.raw_decode(buffer, position)
+                    # A number that is not followed by a separator may be cut short
+                    if end_of_input or (
+                            end < len(buffer) and buffer[end] in _SEPARATORS + "]"
+                    ):
+                        position = end
+                        yield value
+                        continue
+                except json.JSONDecodeError:
+                    if end_of_input:
+                        raise
+
+        if end_of_input:
+            raise ValueError("Unexpected end of JSON array")
+        chunk = next(chunks, None)
+        if chunk is None:
+            end_of_input = True
+            buffer = buffer[position:] + text_decoder.decode(b"", final=True)
+        else:
+            buffer = buffer[position:] + text_decoder.decode(chunk)
+        position = 0
+
+
+# Group an element iterator into lists of up to size elements, or NumPy arrays
+# if a dtype is given
+def iter_batches(elements, size, dtype=None):
+    batch = []
+    for element in elements:
+        batch.append(element)
+        if len(batch) == size:
+            yield _make_batch(batch, dtype)
+            batch = []
+    if batch:
+        yield _make_batch(batch, dtype)
+
+
+def _make_batch(batch, dtype):
+    if dtype is None:
+        return batch
+    return arrays.numpy.asarray(batch, dtype=dtype)
+
+
+# Fill a preallocated array (or memory mapped array) from batches of elements.
+# Returns the number of elements written.
+def fill_array(target, batches):
+    offset = 0
+    for batch in batches:
+        if offset + len(batch) > len(target):
+            raise ValueError("Target array is too small for the field")
+        target[offset: offset + len(batch)] = batch
+        offset += len(batch)
+    return offset
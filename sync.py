@@ -0,0 +1,217 @@
+###################################################################################################
+#
+#   Caffa
+#   Copyright (C) Kontur AS
+#
+#   GNU Lesser General Public License Usage
+#   This library is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation; either version 2.1 of the License, or
+#   (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful, but WITHOUT ANY
+#   WARRANTY; without even the implied warranty of MERCHANTABILITY or
+#   FITNESS FOR A PARTICULAR PURPOSE.
+#
+#   See the GNU Lesser General Public License at <<http:#www.gnu.org/licenses/lgpl-2.1.html>>
+#   for more details.
+#
+import threading
+
+from . import codec, crawler
+
+
+# Keeps a local object graph of a document in step with the server, transferring
+# only what changed since the last sync.
+#
+# pull() re-reads the objects of the document. If the server provides entity
+# tags on /objects/<uuid>, unchanged objects are skipped with a conditional GET.
+# Otherwise their fields are compared by hash with the last synced values, so
+# only changed fields are replaced. New child objects are read and removed ones
+# dropped. Local edits to fields that did not change on the server are kept.
+#
+# The hash comparison saves work on the client but not on the wire: without
+# entity tags, every pull() still downloads every object of the document. For
+# large documents on such servers, use notifications to limit what is re-read.
+#
+# With notifications=True, pull() only re-reads objects reported through
+# notify_changed(), which is the hook for change events from an observing session.
+#
+# push() writes the fields edited locally since the last sync back to the server,
+# one batched write per changed object. Fields holding child objects are not
+# pushed, since the tree structure can only be changed on the server.
+#
+# fields limits the fields synced, as for RestClient.load_tree(). The local graph
+# consists of regular local objects sharing the synced data, so objects from
+# root stay current across syncs.
+class TreeSync:
+    def __init__(
+            self,
+            client,
+            document_id,
+            fields=None,
+            max_concurrency=8,
+            notifications=False,
+    ):
+        self.client = client
+        self.document_id = document_id
+        self.fields = fields
+        self.max_concurrency = max_concurrency
+
+        self._root = crawler.object_node(client.document_skeleton(document_id))
+        self._nodes = {self._root["uuid"]: self._root}
+        self._etags = {}
+        self._field_hashes = {}
+        self._changed = set() if notifications else None
+        self._lock = threading.Lock()
+
+        self.pull()
+        self.root = client.create_local_object(self._root["keyword"], self._root)
+
+    # Report an object as changed on the server, for the next pull()
+    def notify_changed(self, object_uuid):
+        with self._lock:
+            if self._changed is not None:
+                self._changed.add(object_uuid)
+
+    # Bring the local graph up to date. Returns the uuids of the objects that changed.
+    def pull(self):
+        if self._changed is None or not self._field_hashes:
+            level = [self._root]
+            read_all = True
+        else:
+            with self._lock:
+                changed, self._changed = self._changed, set()
+            level = [self._nodes[uuid] for uuid in changed if uuid in self._nodes]
+            read_all = False
+
+        changed_uuids = set()
+        visited = set()
+        with self.client.create_executor(self.max_concurrency) as executor:
+            while level:
+                results = executor.map(self._read, level)
+                next_level = []
+                for node, (values, etag) in zip(level, results):
+                    visited.add(node["uuid"])
+                    if etag is not None:
+                        self._etags[node["uuid"]] = etag
+                    # Newly found children are always read
+                    if values is not None and self._apply(node, values, next_level):
+                        changed_uuids.add(node["uuid"])
+                    if read_all:
+                        next_level.extend(
+                            child
+                            for child in _children(node)
+                            if child["uuid"] not in visited
+                        )
+                level = _unique(next_level, visited)
+
+        self._prune()
+        return changed_uuids
+
+    # Write local edits back to the server. Returns the names of the pushed
+    # fields by object uuid.
+    def push(self):
+        diffs = {}
+        for object_uuid, node in list(self._nodes.items()):
+            diff = {}
+            for name, synced_hash in self._field_hashes.get(object_uuid, {}).items():
+                value = node.get(name)
+                if not _contains_object(value) and _field_hash(value) != synced_hash:
+                    diff[name] = value
+            if diff:
+                diffs[object_uuid] = diff
+
+        def write(item):
+            object_uuid, diff = item
+            self.client.set_field_values(object_uuid, diff)
+
+        self.client.map_concurrently(write, list(diffs.items()))
+
+        for object_uuid, diff in diffs.items():
+            field_hashes = self._field_hashes[object_uuid]
+            for name, value in diff.items():
+                field_hashes[name] = _field_hash(value)
+            # Our own write changed the version on the server
+            self._etags.pop(object_uuid, None)
+        return {object_uuid: list(diff) for object_uuid, diff in diffs.items()}
+
+    def _read(self, node):
+        names = crawler.object_field_names(self.client, node, self.fields)
+        if not names:
+            return {}, None
+        return self.client.get_changed_field_values(
+            node["uuid"], names, self._etags.get(node["uuid"])
+        )
+
+    # Replace the fields that changed since the last sync. Returns False if none did.
+    def _apply(self, node, values, new_nodes):
+        field_hashes = {name: _field_hash(value) for name, value in values.items()}
+        synced_hashes = self._field_hashes.get(node["uuid"])
+        if field_hashes == synced_hashes:
+            return False
+
+        for name, value in values.items():
+            if synced_hashes is None or synced_hashes.get(name) != field_hashes[name]:
+                node[name] = crawler.link_objects(value, self._nodes, new_nodes, True)
+        self._field_hashes[node["uuid"]] = field_hashes
+        return True
+
+    # Forget objects no longer in the document
+    def _prune(self):
+        reachable = set()
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node["uuid"] in reachable:
+                continue
+            reachable.add(node["uuid"])
+            stack.extend(_children(node))
+
+        for object_uuid in list(self._nodes):
+            if object_uuid not in reachable:
+                del self._nodes[object_uuid]
+                self._etags.pop(object_uuid, None)
+                self._field_hashes.pop(object_uuid, None)
+
+
+def _children(node):
+    children = []
+    for value in node.values():
+        _collect_objects(value, children)
+    return children
+
+
+def _collect_objects(value, objects):
+    if isinstance(value, list):
+        for item in value:
+            _collect_objects(item, objects)
+    elif crawler.is_object(value):
+        objects.append(value)
+
+
+def _contains_object(value):
+    objects = []
+    _collect_objects(value, objects)
+    return bool(objects)
+
+
+def _unique(nodes, visited):
+    unique = {}
+    for node in nodes:
+        if node["uuid"] not in visited:
+            unique.setdefault(node["uuid"], node)
+    return list(unique.values())
+
+
+# Child objects only count by identity, their own fields are synced separately
+def _field_hash(value):
+    return hash(codec.dumps_bytes(_references(value)))
+
+
+def _references(value):
+    if isinstance(value, list):
+        return [_references(item) for item in value]
+    if crawler.is_object(value):
+        return {"uuid": value["uuid"]}
+    return value
@@ -0,0 +1,123 @@
+import caffa
+import os
+import pytest
+
+from fakeserver import FakeCaffaServer
+
+pytest.importorskip("pytest_benchmark")
+
+# Client benchmarks against the in-process fake server. They are skipped unless
+# asked for, so run them with
+#   pytest tests/benchmarks --benchmarks --benchmark-autosave
+# and compare runs with --benchmark-compare to catch performance regressions.
+# By default the fake server responds immediately, so the numbers measure client
+# overhead. Set CAFFA_BENCHMARK_LATENCY to a delay in seconds per request to see
+# the effect of the number of requests made over a slow network.
+
+VECTOR_SIZE = 100000
+LATENCY = float(os.environ.get("CAFFA_BENCHMARK_LATENCY", "0"))
+
+
+@pytest.fixture(scope="module")
+def server():
+    with FakeCaffaServer(
+            tree_depth=3, children_per_object=4, latency=LATENCY
+    ) as server:
+        yield server
+
+
+@pytest.fixture(scope="module")
+def vector_server():
+    with FakeCaffaServer(
+            children_per_object=1, vector_size=VECTOR_SIZE, latency=LATENCY
+    ) as server:
+        yield server
+
+
+def connect(server, **kwargs):
+    return caffa.RestClient(
+        server.hostname, server.port, username="test", password="password", **kwargs
+    )
+
+
+@pytest.fixture(scope="module")
+def client(server):
+    client = connect(server)
+    yield client
+    client.quit()
+
+
+@pytest.fixture(scope="module")
+def vector_client(vector_server):
+    client = connect(vector_server)
+    yield client
+    client.quit()
+
+
+def test_connect(benchmark, server):
+    def connect_and_quit():
+        connect(server).quit()
+
+    benchmark(connect_and_quit)
+
+
+def test_document(benchmark, client):
+    doc = benchmark(client.document, "testDocument")
+    assert doc.keyword == "DemoDocument"
+
+
+def test_get_field(benchmark, client):
+    demo_object = client.document("testDocument").demoObject
+    assert benchmark(demo_object.get, "intField") == 1
+
+
+def test_set_field(benchmark, client):
+    demo_object = client.document("testDocument").demoObject
+    benchmark(demo_object.set, "doubleField", 2.0)
+    assert demo_object.doubleField == 2.0
+
+
+def test_to_dict(benchmark, client):
+    demo_object = client.document("testDocument").demoObject
+    content = benchmark(demo_object.to_dict)
+    assert content["keyword"] == "DemoObject"
+
+
+def test_load_tree(benchmark, client, server):
+    doc = benchmark(client.load_tree, "testDocument")
+    assert len(doc.children) == 4
+
+
+def test_to_dict_loaded_tree(benchmark, client):
+    doc = client.load_tree("testDocument")
+    content = benchmark(doc.to_dict)
+    assert content["id"] == "testDocument"
+
+
+def test_execute_method(benchmark, client):
+    demo_object = client.document("testDocument").demoObject
+    benchmark(demo_object.copyValues, 42, 97.0, "Value")
+    assert demo_object.intField == 42
+
+
+def test_get_vector(benchmark, vector_client):
+    demo_object = vector_client.document("testDocument").demoObject
+    values = benchmark(demo_object.get, "floatVector")
+    assert len(values) == VECTOR_SIZE
+
+
+def test_set_vector(benchmark, vector_client):
+    demo_object = vector_client.document("testDocument").demoObject
+    values = [float(i) for i in range(VECTOR_SIZE)]
+    benchmark(demo_object.set, "floatVector", values)
+
+
+def test_get_numpy_vector(benchmark, vector_server):
+    pytest.importorskip("numpy")
+    client = connect(vector_server, numpy_arrays=True)
+    try:
+        demo_object = client.document("testDocument").demoObject
+        values = benchmark(demo_object.get, "floatVector")
+        assert len(values) == VECTOR_SIZE
+    finally:
+        client.quit()
@@ -0,0 +1,37 @@
+import caffa
+import pytest
+
+from fakeserver import FakeCaffaServer
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--fake-server",
+        action="store_true",
+        help="Run the tests against an in-process fake server on 127.0.0.1:50000",
+    )
+    parser.addoption(
+        "--benchmarks",
+        action="store_true",
+        help="Run the benchmarks in tests/benchmarks, which are skipped by default",
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--benchmarks"):
+        return
+    skip = pytest.mark.skip(reason="Benchmarks only run with --benchmarks")
+    for item in items:
+        if "benchmark" in getattr(item, "fixturenames", ()):
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def default_server(request):
+    if not request.config.getoption("--fake-server"):
+        yield None
+        return
+    with FakeCaffaServer(port=50000) as server:
+        yield server
+        # Close pooled sessions while the server is still there to accept it
+        caffa.clientpool.default_pool.close_all()
@@ -0,0 +1,453 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import socketserver
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+# An in-process stand-in for a Caffa REST server, for running the tests and
+# benchmarks without a real server. It serves one document ("testDocument") of
+# DemoObjects, with the schemas, fields and methods the tests rely on.
+#
+# tree_depth and children_per_object control the size of the object tree,
+# vector_size the length of the vector fields, and latency adds a delay in
+# seconds to every response to mimic a remote server. With etags=True, all GET
+# responses carry entity tags derived from their content and honour If-None-Match.
+# With compression=True, large responses are gzip compressed for clients that
+# accept it, and gzip compressed requests are accepted (and advertised as such).
+# Otherwise compressed requests are rejected with 415 Unsupported Media Type.
+# With a socket_path, the server listens on a Unix domain socket instead of TCP.
+# Statuses appended to fail_statuses are sent, in order, in response to the next
+# requests instead of serving them. version is the (major, minor, patch) version
+# reported by /app/info, and can be changed to mimic a server upgrade.
+# With object_get=False, GET /objects/<uuid> is answered with 404 like on servers
+# without whole-object reads, and the fields have to be read one by one.
+# object_put=False does the same for PUT /objects/<uuid>. All requests are logged
+# as (method, path) in requests.
+
+SCHEMA_PREFIX = "#/components/object_schemas/"
+
+_METHODS = {
+    "copyValues": {
+        "type": "object",
+        "properties": {
+            "labelledArguments": {
+                "type": "object",
+                "properties": {
+                    "intValue": {"type": "integer"},
+                    "doubleValue": {"type": "number"},
+                    "stringValue": {"type": "string"},
+                },
+            },
+            "positionalArguments": {
+                "type": "array",
+                "items": [
+                    {"type": "integer"},
+                    {"type": "number"},
+                    {"type": "string"},
+                ],
+            },
+        },
+    },
+    "setIntVector": {
+        "type": "object",
+        "properties": {
+            "labelledArguments": {
+                "type": "object",
+                "properties": {"intVector": {"type": "array"}},
+            },
+            "positionalArguments": {"type": "array", "items": [{"type": "array"}]},
+        },
+    },
+    "getIntVector": {"type": "object", "properties": {}},
+}
+
+SCHEMAS = {
+    "Object": {
+        "allOf": [
+            {
+                "type": "object",
+                "properties": {
+                    "keyword": {"type": "string"},
+                    "uuid": {"type": "string"},
+                },
+            }
+        ]
+    },
+    "DemoObject": {
+        "allOf": [
+            {"$ref": SCHEMA_PREFIX + "Object"},
+            {
+                "type": "object",
+                "properties": {
+                    "doubleField": {"type": "number"},
+                    "intField": {"type": "integer"},
+                    "stringField": {"type": "string"},
+                    "proxyIntVector": {
+                        "type": "array",
+                        "items": {"type": "integer", "format": "int32"},
+                    },
+                    "floatVector": {
+                        "type": "array",
+                        "items": {"type": "number", "format": "float"},
+                    },
+                    "enumField": {"type": "string", "enum": ["T1", "T2", "T3"]},
+                    "children": {"type": "array"},
+                    "methods": {"type": "object", "properties": _METHODS},
+                },
+            },
+        ]
+    },
+    "DemoDocument": {
+        "allOf": [
+            {"$ref": SCHEMA_PREFIX + "Object"},
+            {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "string", "readOnly": True},
+                    "demoObject": {"type": "object"},
+                    "children": {"type": "array"},
+                },
+            },
+        ]
+    },
+}
+
+_SCHEMA_PATH = re.compile(r"/openapi.json/components/object_schemas(?:/(\w+))?$")
+_DOCUMENT_PATH = re.compile(r"/documents/(\w+)$")
+_OBJECT_PATH = re.compile(r"/objects/([\w-]+)$")
+_FIELD_PATH = re.compile(r"/objects/([\w-]+)/fields/([\w$]+)$")
+_METHOD_PATH = re.compile(r"/objects/([\w-]+)/methods/(\w+)$")
+
+
+class FakeCaffaServer:
+    def __init__(
+            self,
+            hostname="127.0.0.1",
+            port=0,
+            tree_depth=1,
+            children_per_object=5,
+            vector_size=0,
+            latency=0.0,
+            etags=False,
+            compression=False,
+            socket_path=None,
+            object_get=True,
+            object_put=True,
+    ):
+        self.latency = latency
+        self.object_get = object_get
+        self.object_put = object_put
+        self.etags = etags
+        self.compression = compression
+        self.compressed_requests = 0
+        self.request_count = 0
+        self.requests = []
+        self.fail_statuses = []
+        self.version = (1, 6, 0)
+        self.objects = {}
+        self.document = self._make_document(
+            tree_depth, children_per_object, vector_size
+        )
+
+        if socket_path is not None:
+            self._server = _ThreadingUnixHTTPServer(socket_path, _UnixRequestHandler)
+            self.hostname, self.port = "localhost", port
+        else:
+            self._server = ThreadingHTTPServer((hostname, port), _RequestHandler)
+            self.hostname, self.port = self._server.server_address[:2]
+        self._server.daemon_threads = True
+        self._server.caffa = self
+        self.socket_path = socket_path
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        if self.socket_path is not None:
+            os.unlink(self.socket_path)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _make_object(self, keyword, **fields):
+        json_object = {
+            "keyword": keyword,
+            "uuid": str(uuid.uuid4()),
+            "$id": SCHEMA_PREFIX + keyword,
+        }
+        json_object.update(fields)
+        self.objects[json_object["uuid"]] = json_object
+        return json_object
+
+    def _make_demo_object(self, depth, children_per_object, vector_size):
+        children = []
+        if depth > 1:
+            children = [
+                self._make_demo_object(depth - 1, children_per_object, vector_size)
+                for _ in range(children_per_object)
+            ]
+        return self._make_object(
+            "DemoObject",
+            doubleField=1.0,
+            intField=1,
+            stringField="Hello",
+            proxyIntVector=list(range(vector_size)),
+            floatVector=[float(i) for i in range(vector_size)],
+            enumField="T1",
+            children=children,
+        )
+
+    def _make_document(self, tree_depth, children_per_object, vector_size):
+        return self._make_object(
+            "DemoDocument",
+            id="testDocument",
+            demoObject=self._make_demo_object(1, 0, vector_size),
+            children=[
+                self._make_demo_object(tree_depth, children_per_object, vector_size)
+                for _ in range(children_per_object)
+            ],
+        )
+
+    def execute(self, json_object, method_name, arguments):
+        if method_name == "copyValues":
+            if "labelledArguments" in arguments:
+                labelled = arguments["labelledArguments"]
+                values = [
+                    labelled["intValue"],
+                    labelled["doubleValue"],
+                    labelled["stringValue"],
+                ]
+            else:
+                values = arguments["positionalArguments"]
+            (
+                json_object["intField"],
+                json_object["doubleField"],
+                json_object["stringField"],
+            ) = values
+            return None
+        if method_name == "setIntVector":
+            if "labelledArguments" in arguments:
+                json_object["proxyIntVector"] = arguments["labelledArguments"][
+                    "intVector"
+                ]
+            else:
+                json_object["proxyIntVector"] = arguments["positionalArguments"][0]
+            return None
+        if method_name == "getIntVector":
+            return json_object["proxyIntVector"]
+        raise KeyError(method_name)
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Avoid delayed ACKs adding ~40 ms to every small request
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def caffa(self):
+        return self.server.caffa
+
+    def parse_request(self):
+        if not super().parse_request():
+            return False
+        if not self.caffa.fail_statuses:
+            return True
+        self.caffa.request_count += 1
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self._send(self.caffa.fail_statuses.pop(0), "Injected failure")
+        return False
+
+    def _begin(self):
+        self.caffa.request_count += 1
+        self.caffa.requests.append((self.command, urlsplit(self.path).path))
+        if self.caffa.latency > 0:
+            time.sleep(self.caffa.latency)
+        return urlsplit(self.path).path
+
+    def _send(self, status, value, headers=None):
+        body = json.dumps(value).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if self.caffa.compression:
+            self.send_header("Accept-Encoding", "gzip")
+            if len(body) > 1024 and "gzip" in self.headers.get("Accept-Encoding", ""):
+                body = gzip.compress(body)
+                self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        for name, header_value in (headers or {}).items():
+            self.send_header(name, header_value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Send the response to a GET request, or 304 if the client has it already
+    def _send_value(self, value):
+        if not self.caffa.etags:
+            return self._send(200, value)
+        body = json.dumps(value).encode("utf-8")
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self._send(200, value, {"ETag": etag})
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length == 0:
+            return None
+        body = self.rfile.read(length)
+        if self.headers.get("Content-Encoding") == "gzip":
+            self.caffa.compressed_requests += 1
+            body = gzip.decompress(body)
+        return json.loads(body)
+
+    def _accepts_body(self):
+        encoding = self.headers.get("Content-Encoding")
+        if encoding is None or (self.caffa.compression and encoding == "gzip"):
+            return True
+        # Read the body to keep the connection usable
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self._send(415, "Unsupported Content-Encoding")
+        return False
+
+    def do_GET(self):
+        path = self._begin()
+        objects = self.caffa.objects
+        if path == "/app/info":
+            return self._send_value(
+                {
+                    "name": "Fake Caffa Server",
+                    "type": 0,
+                    "major_version": self.caffa.version[0],
+                    "minor_version": self.caffa.version[1],
+                    "patch_version": self.caffa.version[2],
+                },
+            )
+
+        match = _SCHEMA_PATH.match(path)
+        if match:
+            if match.group(1) is None:
+                return self._send_value(SCHEMAS)
+            if match.group(1) in SCHEMAS:
+                return self._send_value(SCHEMAS[match.group(1)])
+            return self._send(404, "No such schema")
+
+        match = _DOCUMENT_PATH.match(path)
+        if match:
+            if match.group(1) != self.caffa.document["id"]:
+                return self._send(404, "No such document")
+            return self._send_value(self.caffa.document)
+
+        match = _OBJECT_PATH.match(path)
+        if match and match.group(1) in objects and self.caffa.object_get:
+            return self._send_value(objects[match.group(1)])
+
+        match = _FIELD_PATH.match(path)
+        if match and match.group(1) in objects:
+            json_object = objects[match.group(1)]
+            if match.group(2) not in json_object:
+                return self._send(404, "No such field")
+            return self._send_value(json_object[match.group(2)])
+
+        self._send(404, "Not found")
+
+    def do_PUT(self):
+        path = self._begin()
+        objects = self.caffa.objects
+        if not self._accepts_body():
+            return
+        value = self._body()
+        if path.startswith("/sessions/"):
+            return self._send(200, None)
+
+        match = _OBJECT_PATH.match(path)
+        if match and match.group(1) in objects and self.caffa.object_put:
+            for field_name, field_value in value.items():
+                error = _validate(objects[match.group(1)], field_name, field_value)
+                if error is not None:
+                    return self._send(400, error)
+            objects[match.group(1)].update(value)
+            return self._send(200, None)
+
+        match = _FIELD_PATH.match(path)
+        if match and match.group(1) in objects:
+            json_object = objects[match.group(1)]
+            error = _validate(json_object, match.group(2), value)
+            if error is not None:
+                return self._send(400, error)
+            json_object[match.group(2)] = value
+            return self._send(200, None)
+
+        self._send(404, "Not found")
+
+    def do_POST(self):
+        path = self._begin()
+        objects = self.caffa.objects
+        if not self._accepts_body():
+            return
+        arguments = self._body()
+        if path.startswith("/sessions"):
+            return self._send(200, {"uuid": str(uuid.uuid4())})
+
+        match = _METHOD_PATH.match(path)
+        if match and match.group(1) in objects:
+            try:
+                result = self.caffa.execute(
+                    objects[match.group(1)], match.group(2), arguments or {}
+                )
+            except KeyError:
+                return self._send(404, "No such method")
+            return self._send(200, result)
+
+        self._send(404, "Not found")
+
+    def do_OPTIONS(self):
+        self._begin()
+        self._send(200, {"type": "REGULAR", "valid": True, "timeout": 3000})
+
+    def do_DELETE(self):
+        self._begin()
+        self._send(200, None)
+
+
+class _ThreadingUnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    pass
+
+
+class _UnixRequestHandler(_RequestHandler):
+    # TCP_NODELAY does not apply to Unix domain sockets
+    disable_nagle_algorithm = False
+
+    # Unix socket peers have no address
+    def address_string(self):
+        return self.server.server_address
+
+
+def _validate(json_object, field_name, value):
+    schema = SCHEMAS[json_object["keyword"]]["allOf"][1]["properties"]
+    if field_name not in schema:
+        return "No such field"
+    if schema[field_name].get("readOnly"):
+        return "Field is read only"
+    if "enum" in schema[field_name] and value not in schema[field_name]["enum"]:
+        return "Invalid enum value"
+    return None
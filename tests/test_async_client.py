@@ -0,0 +1,121 @@
+import asyncio
+import caffa
+import logging
+import pytest
+
+from fakeserver import FakeCaffaServer
+
+pytest.importorskip("aiohttp")
+
+log = logging.getLogger("test_async_client")
+hostname = "127.0.0.1"
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_async_connection():
+    async def connect():
+        async with caffa.AsyncRestClient(
+                hostname, username="test", password="password"
+        ) as client:
+            app_info = await client.app_info()
+            assert app_info.name != ""
+
+    run(connect())
+
+
+def test_async_fields():
+    async def fields():
+        async with caffa.AsyncRestClient(
+                hostname, username="test", password="password"
+        ) as client:
+            doc = await client.document("testDocument")
+            assert doc is not None
+            assert await doc.aget("id") == "testDocument"
+
+            demo_object = await doc.aget("demoObject")
+            await demo_object.aset("intField", 43)
+            assert await demo_object.aget("intField") == 43
+
+            values = await demo_object.aget_many(["intField", "proxyIntVector"])
+            assert values["intField"] == 43
+
+    run(fields())
+
+
+def test_async_methods():
+    async def methods():
+        async with caffa.AsyncRestClient(
+                hostname, username="test", password="password"
+        ) as client:
+            doc = await client.document("testDocument")
+            demo_object = await doc.aget("demoObject")
+            await demo_object.setIntVector(intVector=[1, 2, 97])
+            assert await demo_object.getIntVector() == [1, 2, 97]
+
+    run(methods())
+
+
+def test_async_objects_refuse_blocking_calls():
+    async def blocking_calls():
+        async with caffa.AsyncRestClient(
+                hostname, username="test", password="password"
+        ) as client:
+            doc = await client.document("testDocument")
+            with pytest.raises(TypeError, match="AsyncRestClient"):
+                doc.id
+            demo_object = await doc.aget("demoObject")
+            with pytest.raises(TypeError, match="AsyncRestClient"):
+                demo_object.to_dict()
+            with pytest.raises(TypeError, match="AsyncRestClient"):
+                demo_object.set("intField", 55)
+            with pytest.raises(TypeError, match="AsyncRestClient"):
+                demo_object.intField = 55
+            with pytest.raises(TypeError, match="AsyncRestClient"):
+                demo_object.set_fields(intField=55)
+            with pytest.raises(TypeError, match="AsyncRestClient"):
+                with demo_object.batch():
+                    pass
+            assert await demo_object.aget("intField") != 55
+
+    run(blocking_calls())
+
+
+def test_async_set_fields():
+    async def set_fields():
+        async with caffa.AsyncRestClient(
+                hostname, username="test", password="password"
+        ) as client:
+            doc = await client.document("testDocument")
+            demo_object = await doc.aget("demoObject")
+            await demo_object.aset_fields(intField=56, stringField="Async")
+            values = await demo_object.aget_many(["intField", "stringField"])
+            assert values == {"intField": 56, "stringField": "Async"}
+
+    run(set_fields())
+
+
+def test_async_connect_failure(monkeypatch):
+    async def failing_preload(self):
+        raise RuntimeError("Schema preload failed")
+
+    monkeypatch.setattr(caffa.AsyncRestClient, "preload_schemas", failing_preload)
+
+    async def connect(server):
+        client = caffa.AsyncRestClient(
+            server.hostname, server.port, preload_schemas=True
+        )
+        with pytest.raises(RuntimeError, match="Schema preload failed"):
+            await client.connect()
+        return client
+
+    # A failure after the session was created closes it before raising
+    with FakeCaffaServer() as server:
+        client = run(connect(server))
+        assert client.session.closed
+        session_requests = [
+            method for method, path in server.requests if path.startswith("/sessions")
+        ]
+        assert session_requests.count("DELETE") == session_requests.count("POST") == 1
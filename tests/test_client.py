@@ -1,6 +1,12 @@
+import asyncio
 import caffa
 import logging
 import pytest
+import socket
+import threading
+import time
+
+from fakeserver import FakeCaffaServer
 
 log = logging.getLogger("test_client")
 hostname = "127.0.0.1"
@@ -46,3 +52,502 @@ def test_schemas():
     except Exception as e:
         pytest.fail("Failed with exception {0}".format(e))
     client.quit()
+
+
+def test_shared_clients():
+    pool = caffa.ClientPool(idle_timeout=60.0)
+    client = pool.acquire(hostname, username="test", password="password")
+    other_client = pool.acquire(hostname, username="test", password="password")
+    assert client is other_client
+    assert len(pool) == 1
+
+    other_user_client = pool.acquire(hostname, username="other", password="password")
+    assert other_user_client is not client
+    assert len(pool) == 2
+
+    client.quit()
+    other_client.quit()
+    other_user_client.quit()
+    assert len(pool) == 2
+
+    pool.close_all()
+    assert len(pool) == 0
+
+
+def test_shared_client_options():
+    assert caffa.ClientPool(idle_timeout=0).idle_timeout == 0
+
+    pool = caffa.ClientPool(idle_timeout=60.0)
+    client = pool.acquire(hostname, username="test", password="password")
+    timeout_client = pool.acquire(
+        hostname, username="test", password="password", timeout=(1.0, 2.0)
+    )
+    assert timeout_client is not client
+    assert timeout_client.timeout == (1.0, 2.0)
+    assert client.timeout != (1.0, 2.0)
+    assert timeout_client is pool.acquire(
+        hostname, username="test", password="password", timeout=(1.0, 2.0)
+    )
+    assert len(pool) == 2
+
+    # Releasing a client too often must not make its reference count negative
+    timeout_client.quit()
+    timeout_client.quit()
+    timeout_client.quit()
+    assert pool._reference_counts[timeout_client._pool_key] == 0
+
+    client.quit()
+    pool.close_all()
+    assert len(pool) == 0
+
+
+def test_schema_cache():
+    with FakeCaffaServer() as server:
+        client = caffa.RestClient(server.hostname, server.port)
+        try:
+            location = client.schema_location_from_keyword("DemoObject")
+            properties = client.schema_properties(location)
+            count = server.request_count
+            assert client.schema_properties(location) is properties
+            assert client.object_class("DemoObject") is client.object_class(
+                "DemoObject"
+            )
+            assert server.request_count == count
+
+            # The schemas are kept when reconnecting to the same version
+            client.reconnect()
+            count = server.request_count
+            assert client.schema_properties(location) is properties
+            assert server.request_count == count
+
+            server.version = (1, 6, 1)
+            client.reconnect()
+            count = server.request_count
+            assert client.schema_properties(location) == properties
+            assert server.request_count > count
+        finally:
+            client.quit()
+
+
+def test_version_check_on_session_error():
+    with FakeCaffaServer() as server:
+        client = caffa.RestClient(
+            server.hostname, server.port, retry_policy=caffa.retry.NO_RETRIES
+        )
+        try:
+            location = client.schema_location_from_keyword("DemoObject")
+            client.schema_properties(location)
+            assert location in client._schema_properties_cache
+
+            # The server restarts as a new version and has forgotten the session
+            server.version = (1, 6, 1)
+            server.fail_statuses.append(404)
+            client.keepalive_interval = 0.01
+            deadline = time.monotonic() + 5.0
+            while location in client._schema_properties_cache:
+                assert time.monotonic() < deadline, "Schema cache was not cleared"
+                time.sleep(0.01)
+        finally:
+            client.quit()
+
+
+def keepalives(server, client):
+    path = "/sessions/" + client.session_uuid
+    return sum(1 for request in server.requests if request == ("PUT", path))
+
+
+def test_idle_keepalives(monkeypatch):
+    monkeypatch.setattr(caffa.RestClient, "default_keepalive_interval", 0.05)
+    monkeypatch.setattr(caffa.RestClient, "keepalive_fraction", 0.0)
+    with FakeCaffaServer() as server:
+        client = caffa.RestClient(server.hostname, server.port)
+        try:
+            assert client.keepalive_interval == 0.05
+            # No keepalives while other requests keep the session alive
+            deadline = time.monotonic() + 0.5
+            while time.monotonic() < deadline:
+                client.app_info()
+                time.sleep(0.01)
+            assert keepalives(server, client) == 0
+
+            time.sleep(0.5)
+            assert keepalives(server, client) > 0
+        finally:
+            client.quit()
+
+
+def test_quit_stops_keepalives(monkeypatch):
+    monkeypatch.setattr(caffa.RestClient, "default_keepalive_interval", 60.0)
+    with FakeCaffaServer() as server:
+        client = caffa.RestClient(server.hostname, server.port)
+        assert client.keepalive_interval == 60.0
+        start_time = time.monotonic()
+        client.quit()
+        assert time.monotonic() - start_time < 0.5
+        assert not client.keepalive_thread.is_alive()
+
+
+def test_metrics():
+    metrics = caffa.Metrics()
+    client = caffa.RestClient(
+        hostname, username="test", password="password", metrics=metrics
+    )
+    metrics.reset()
+    doc = client.document("testDocument")
+    doc.to_dict()
+    snapshot = metrics.snapshot()
+    log.info("Request metrics:\n%s", metrics.report())
+    assert snapshot["request_count"] > 0
+    assert "GET /documents/{document_id}" in snapshot["requests"]
+    assert snapshot["bytes_received"] > 0
+    assert metrics.schema_cache_hits + metrics.schema_cache_misses > 0
+    client.quit()
+
+
+def test_schema_resolution_time():
+    with FakeCaffaServer(latency=0.02) as server:
+        metrics = caffa.Metrics()
+        client = caffa.RestClient(server.hostname, server.port, metrics=metrics)
+        try:
+            location = client.schema_location_from_keyword("DemoObject")
+            client.clear_schema_cache()
+            metrics.reset()
+            start_time = time.perf_counter()
+            client.schema_properties(location)
+            elapsed = time.perf_counter() - start_time
+
+            # DemoObject refers to Object, resolved by a nested lookup that must
+            # not be counted again as part of DemoObject
+            assert metrics.schema_cache_misses == 2
+            assert 0.04 <= metrics.schema_resolution_time <= elapsed
+        finally:
+            client.quit()
+
+
+def test_schema_file(tmp_path):
+    schema_file = str(tmp_path / "schemas.json")
+    client = caffa.RestClient(
+        hostname, username="test", password="password", schema_file=schema_file
+    )
+    schemas = client.schema_list()
+    client.quit()
+
+    metrics = caffa.Metrics()
+    client = caffa.RestClient(
+        hostname,
+        username="test",
+        password="password",
+        schema_file=schema_file,
+        metrics=metrics,
+    )
+    doc = client.document("testDocument")
+    assert doc.keyword in schemas
+    assert not any(
+        template.startswith("GET /openapi.json")
+        for template in metrics.snapshot()["requests"]
+    )
+    client.quit()
+
+
+def test_unwritable_schema_file(tmp_path, monkeypatch):
+    schema_file = str(tmp_path / "missing" / "schemas.json")
+    with FakeCaffaServer() as server:
+        # Failing to write the file does not fail the connection
+        client = caffa.RestClient(server.hostname, server.port, schema_file=schema_file)
+        try:
+            assert "DemoObject" in client.schema_list()
+        finally:
+            client.quit()
+
+        # Other failures close the new session before raising
+        def failing_export(self, path):
+            raise RuntimeError("Schema export failed")
+
+        monkeypatch.setattr(caffa.RestClient, "export_schemas", failing_export)
+        with pytest.raises(RuntimeError, match="Schema export failed"):
+            caffa.RestClient(server.hostname, server.port, schema_file=schema_file)
+        session_requests = [
+            method for method, path in server.requests if path.startswith("/sessions")
+        ]
+        assert session_requests.count("DELETE") == session_requests.count("POST") == 2
+
+
+def test_response_cache():
+    with FakeCaffaServer(etags=True) as server:
+        cache = caffa.ResponseCache()
+        client = caffa.RestClient(server.hostname, server.port, response_cache=cache)
+        schemas = client.schema_list()
+        client.clear_schema_cache()
+        assert client.schema_list() == schemas
+        assert cache.revalidations == 1
+
+        demo_object = client.document("testDocument").demoObject
+        demo_object.intField = 11
+        assert demo_object.intField == 11
+        demo_object.intField = 12
+        assert demo_object.intField == 12
+        client.quit()
+
+
+def test_response_cache_invalidation():
+    with FakeCaffaServer(etags=True) as server:
+        cache = caffa.ResponseCache()
+        client = caffa.RestClient(server.hostname, server.port, response_cache=cache)
+
+        def cached_paths():
+            return sorted(key[1] for key in cache._entries)
+
+        try:
+            demo_object = client.document("testDocument").demoObject
+            assert demo_object.stringField == "Hello"
+            assert demo_object.intField == 1
+            paths = cached_paths()
+            assert "/documents/testDocument" in paths
+            assert "/objects/%s/fields/stringField" % demo_object.uuid in paths
+
+            # A write to one field drops the other fields and the documents too
+            demo_object.intField = 13
+            assert not any(path.startswith("/objects/") for path in cached_paths())
+            assert "/documents/testDocument" not in cached_paths()
+            assert "/app/info" in cached_paths()
+            assert client.document("testDocument").demoObject.intField == 13
+
+            assert demo_object.stringField == "Hello"
+            demo_object.setIntVector([1, 2])
+            assert not any(path.startswith("/objects/") for path in cached_paths())
+
+            # Users do not share cached responses
+            other_client = caffa.RestClient(
+                server.hostname, server.port, "other", response_cache=cache
+            )
+            try:
+                client.document("testDocument")
+                other_client.document("testDocument")
+                users = [
+                    key[3] for key in cache._entries if key[1].startswith("/documents/")
+                ]
+                assert sorted(users) == ["", "other"]
+            finally:
+                other_client.quit()
+        finally:
+            client.quit()
+
+
+def test_compression():
+    with FakeCaffaServer(compression=True, vector_size=10000) as server:
+        # Request compression is opt-in, even if the server advertises it
+        client = caffa.RestClient(server.hostname, server.port)
+        client.document("testDocument").demoObject.setIntVector(list(range(10000)))
+        assert server.compressed_requests == 0
+        client.quit()
+
+        client = caffa.RestClient(server.hostname, server.port, compress_requests=True)
+        demo_object = client.document("testDocument").demoObject
+        values = demo_object.floatVector
+        assert len(values) == 10000
+
+        demo_object.setIntVector(list(range(10000)))
+        assert client._request_encoding == "gzip"
+        assert server.compressed_requests == 1
+        assert demo_object.getIntVector() == list(range(10000))
+
+        batches = list(demo_object.iter_field("floatVector", chunk=4096))
+        assert [len(batch) for batch in batches] == [4096, 4096, 1808]
+        client.quit()
+
+    # A server rejecting compressed bodies gets them uncompressed instead
+    with FakeCaffaServer() as server:
+        client = caffa.RestClient(server.hostname, server.port, compress_requests=True)
+        demo_object = client.document("testDocument").demoObject
+        demo_object.setIntVector(list(range(10000)))
+        assert not client.compress_requests
+        assert demo_object.getIntVector() == list(range(10000))
+        client.quit()
+
+    with pytest.raises(ValueError):
+        caffa.RestClient(hostname, compress_requests="lzma")
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="No Unix domain sockets")
+def test_unix_socket_transport(tmp_path):
+    socket_path = str(tmp_path / "caffa.sock")
+    with FakeCaffaServer(socket_path=socket_path):
+        client = caffa.RestClient(
+            "localhost", transport=caffa.UnixSocketTransport(socket_path)
+        )
+        demo_object = client.document("testDocument").demoObject
+        demo_object.intField = 13
+        assert demo_object.intField == 13
+        client.quit()
+
+
+def test_http2_transport_adapter():
+    httpx = pytest.importorskip("httpx")
+    pytest.importorskip("h2")
+    numpy = pytest.importorskip("numpy")
+    float_vector = numpy.arange(1000, dtype=numpy.float32)
+
+    with FakeCaffaServer() as server:
+        # The mock transport replaces the network connections, so this covers the
+        # conversion of requests and responses, not HTTP/2 itself. The fake
+        # server only speaks HTTP/1.1. See test_http2_transport_h2c.
+        network = httpx.HTTPTransport()
+
+        # Send float vectors as binary arrays, and everything else to the server
+        def handle_request(request):
+            if request.url.path.endswith("/fields/floatVector"):
+                return httpx.Response(
+                    200,
+                    headers={"Content-Type": "application/octet-stream"},
+                    content=float_vector.tobytes(),
+                )
+            return network.handle_request(request)
+
+        transport = caffa.Http2Transport(
+            server.hostname,
+            server.port,
+            httpx_transport=httpx.MockTransport(handle_request),
+        )
+        client = caffa.RestClient(
+            server.hostname, server.port, transport=transport, numpy_arrays=True
+        )
+        try:
+            demo_object = client.document("testDocument").demoObject
+            demo_object.intField = 14
+            assert demo_object.intField == 14
+            values = demo_object.floatVector
+            assert values.dtype == numpy.float32
+            assert values.tolist() == float_vector.tolist()
+        finally:
+            client.quit()
+            network.close()
+
+
+def test_http2_transport_h2c():
+    pytest.importorskip("httpx")
+    pytest.importorskip("h2")
+    pytest.importorskip("hypercorn")
+    import requests
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    body = bytes(range(256)) * 1024
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"application/octet-stream")],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    config = Config()
+    config.bind = ["127.0.0.1:%d" % port]
+    loop = asyncio.new_event_loop()
+    stopped = asyncio.Event()
+
+    def run_server():
+        loop.run_until_complete(serve(app, config, shutdown_trigger=stopped.wait))
+
+    server_thread = threading.Thread(target=run_server, daemon=True)
+    server_thread.start()
+    session = requests.Session()
+    try:
+        deadline = time.monotonic() + 5.0
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1.0).close()
+                break
+            except OSError:
+                assert time.monotonic() < deadline, "Server did not start"
+                time.sleep(0.01)
+
+        # Without TLS, HTTP/2 is spoken with prior knowledge (h2c)
+        transport = caffa.Http2Transport("127.0.0.1", port)
+        transport.mount(session, 1, 10, False)
+        url = transport.base_url() + "/objects"
+        response = session.get(url)
+        assert response.raw._response.extensions["http_version"] == b"HTTP/2"
+        assert response.content == body
+
+        response = session.get(url, stream=True)
+        assert response.raw._response.extensions["http_version"] == b"HTTP/2"
+        buffer = bytearray(len(body))
+        view = memoryview(buffer)
+        received = 0
+        while received < len(body):
+            size = response.raw.readinto(view[received:])
+            assert size > 0
+            received += size
+        assert bytes(buffer) == body
+        response.close()
+    finally:
+        session.close()
+        loop.call_soon_threadsafe(stopped.set)
+        server_thread.join(5.0)
+        loop.close()
+
+
+def test_binary_array_writes():
+    httpx = pytest.importorskip("httpx")
+    numpy = pytest.importorskip("numpy")
+    binary_puts = {}
+
+    with FakeCaffaServer() as server:
+        network = httpx.HTTPTransport()
+
+        # Provide a binary array so the client sends arrays in binary, and keep
+        # the binary writes instead of passing them on to the server
+        def handle_request(request):
+            if request.headers.get("Content-Type") == "application/octet-stream":
+                binary_puts[request.url.path.rsplit("/", 1)[-1]] = request.read()
+                return httpx.Response(200)
+            if request.url.path.endswith("/fields/floatVector"):
+                return httpx.Response(
+                    200,
+                    headers={"Content-Type": "application/octet-stream"},
+                    content=numpy.zeros(3, dtype="<f4").tobytes(),
+                )
+            return network.handle_request(request)
+
+        transport = caffa.Http2Transport(
+            server.hostname,
+            server.port,
+            httpx_transport=httpx.MockTransport(handle_request),
+        )
+        client = caffa.RestClient(
+            server.hostname, server.port, transport=transport, numpy_arrays=True
+        )
+        try:
+            demo_object = client.document("testDocument").demoObject
+            assert demo_object.floatVector.tolist() == [0.0, 0.0, 0.0]
+
+            # Arrays are sent in the data type of the field, not of the value
+            demo_object.floatVector = numpy.array([1.0, 2.0, 3.0])
+            body = binary_puts["floatVector"]
+            assert len(body) == 12
+            assert numpy.frombuffer(body, dtype="<f4").tolist() == [1.0, 2.0, 3.0]
+
+            demo_object.proxyIntVector = numpy.array([1, -2, 3], dtype=numpy.int64)
+            body = binary_puts["proxyIntVector"]
+            assert len(body) == 12
+            assert numpy.frombuffer(body, dtype="<i4").tolist() == [1, -2, 3]
+        finally:
+            client.quit()
+            network.close()
+
+
+def test_transport_endpoints():
+    # Servers on different sockets get their own circuit breakers
+    first = caffa.UnixSocketTransport("/tmp/first.sock").endpoint()
+    second = caffa.UnixSocketTransport("/tmp/second.sock").endpoint()
+    assert first == "unix:/tmp/first.sock"
+    assert caffa.retry.circuit_breaker(first) is not caffa.retry.circuit_breaker(second)
+    assert caffa.TcpTransport("127.0.0.1", 50000).endpoint() == "http://127.0.0.1:50000"
@@ -0,0 +1,70 @@
+import caffa
+import json
+import pytest
+
+from caffa import codec
+from fakeserver import FakeCaffaServer
+
+BACKENDS = ["orjson", "msgspec", "ujson", "json"]
+
+VALUE = {
+    "keyword": "DemoObject",
+    "intField": -42,
+    "doubleField": 0.1,
+    "stringField": "Blåbærsyltetøy ✓",
+    "enabled": True,
+    "nothing": None,
+    "proxyIntVector": [1, 2, 3],
+    "children": [{"keyword": "Child", "values": []}],
+}
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request):
+    if request.param != "json":
+        pytest.importorskip(request.param)
+    default_backend = codec.backend_name()
+    assert codec.use_backend(request.param) == request.param
+    yield request.param
+    codec.use_backend(default_backend)
+
+
+def test_backend_results(backend):
+    text = json.dumps(VALUE)
+    assert codec.loads(text) == VALUE
+    assert codec.loads(text.encode("utf-8")) == VALUE
+    assert isinstance(codec.dumps_bytes(VALUE), bytes)
+    assert json.loads(codec.dumps_bytes(VALUE)) == VALUE
+    assert json.loads(codec.dumps(VALUE)) == VALUE
+
+    namespace = codec.loads_namespace(text.encode("utf-8"))
+    assert namespace.stringField == VALUE["stringField"]
+    assert namespace.children[0].keyword == "Child"
+
+
+def test_backend_numpy_arrays(backend):
+    numpy = pytest.importorskip("numpy")
+    value = {"floatVector": numpy.array([1.5, -2.0], dtype=numpy.float32)}
+    assert json.loads(codec.dumps_bytes(value)) == {"floatVector": [1.5, -2.0]}
+
+
+def test_backend_field_values(backend):
+    with FakeCaffaServer() as server:
+        client = caffa.RestClient(server.hostname, server.port)
+        try:
+            demo_object = client.document("testDocument").demoObject
+            demo_object.stringField = VALUE["stringField"]
+            demo_object.proxyIntVector = VALUE["proxyIntVector"]
+
+            # Field values come back as the undecoded response body
+            json_text = client.get_field_value(demo_object.uuid, "stringField")
+            assert isinstance(json_text, bytes)
+            assert codec.loads(json_text) == VALUE["stringField"]
+            assert demo_object.stringField == VALUE["stringField"]
+            assert demo_object.proxyIntVector == VALUE["proxyIntVector"]
+            assert demo_object.get_many(["intField", "doubleField"]) == {
+                "intField": 1,
+                "doubleField": 1.0,
+            }
+        finally:
+            client.quit()
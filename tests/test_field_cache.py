@@ -0,0 +1,143 @@
+import caffa
+import pytest
+import time
+
+from caffa import fieldcache
+from fakeserver import FakeCaffaServer
+
+
+@pytest.fixture
+def server():
+    with FakeCaffaServer(etags=True) as server:
+        yield server
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.01)
+
+
+def test_lru_eviction():
+    cache = caffa.FieldCache(max_size=2)
+    cache.put("a", "intField", b"1")
+    cache.put("b", "intField", b"2")
+    assert cache.get("a", "intField") == b"1"
+    cache.put("c", "intField", b"3")
+    assert len(cache) == 2
+    assert cache.get("b", "intField") is None
+    assert cache.get("a", "intField") == b"1"
+    assert cache.get("c", "intField") == b"3"
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_ttl_expiry(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(fieldcache.time, "monotonic", lambda: now[0])
+    cache = caffa.FieldCache(ttl=5.0)
+    cache.put("a", "intField", b"1")
+    now[0] += 4.9
+    assert cache.get("a", "intField") == b"1"
+    assert cache.objects() == {"a": {"intField": b"1"}}
+    now[0] += 0.1
+    assert cache.get("a", "intField") is None
+    assert cache.objects() == {}
+
+
+def test_invalidation():
+    cache = caffa.FieldCache()
+    cache.put("a", "intField", b"1")
+    cache.put("a", "stringField", b'"x"')
+    cache.put("b", "intField", b"2")
+    cache.invalidate("a", "intField")
+    assert cache.get("a", "intField") is None
+    assert cache.get("a", "stringField") == b'"x"'
+    cache.invalidate("a")
+    assert cache.objects() == {"b": {"intField": b"2"}}
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_stale_put_after_invalidation():
+    cache = caffa.FieldCache()
+    generation = cache.generation
+    # The field is written while a read of the old value is in flight
+    cache.invalidate("a", "intField")
+    cache.put("a", "intField", b"1", generation)
+    assert cache.get("a", "intField") is None
+    cache.put("a", "intField", b"2", cache.generation)
+    assert cache.get("a", "intField") == b"2"
+
+
+def test_cached_object_reads(server):
+    client = caffa.RestClient(server.hostname, server.port)
+    try:
+        client.enable_field_cache()
+        demo_object = client.document("testDocument").demoObject
+        values = demo_object.get_many(["intField", "doubleField"])
+        assert values == {"intField": 1, "doubleField": 1.0}
+
+        # The whole object was read, so all its fields are cached
+        count = server.request_count
+        assert demo_object.stringField == "Hello"
+        assert demo_object.intField == 1
+        assert server.request_count == count
+
+        demo_object.intField = 2
+        assert demo_object.intField == 2
+    finally:
+        client.quit()
+
+
+def test_cached_arrays(server):
+    numpy = pytest.importorskip("numpy")
+    client = caffa.RestClient(server.hostname, server.port, numpy_arrays=True)
+    try:
+        client.enable_field_cache()
+        demo_object = client.document("testDocument").demoObject
+        demo_object.floatVector = numpy.array([1.0, 2.0, 3.0])
+        assert demo_object.floatVector.tolist() == [1.0, 2.0, 3.0]
+
+        count = server.request_count
+        values = demo_object.floatVector
+        assert isinstance(values, numpy.ndarray)
+        assert values.tolist() == [1.0, 2.0, 3.0]
+        assert server.request_count == count
+    finally:
+        client.quit()
+
+
+def test_observed_invalidation(server):
+    client = caffa.RestClient(server.hostname, server.port)
+    try:
+        field_cache = client.enable_field_cache(observe_interval=0.02)
+        demo_object = client.document("testDocument").demoObject
+        assert demo_object.intField == 1
+        assert field_cache.get(demo_object.uuid, "intField") == b"1"
+
+        # Changed behind the client's back, for instance by another client
+        server.objects[demo_object.uuid]["intField"] = 99
+        wait_for(lambda: field_cache.get(demo_object.uuid, "intField") is None)
+        assert demo_object.intField == 99
+    finally:
+        client.quit()
+
+
+def test_observer_without_etags():
+    with FakeCaffaServer() as server:
+        client = caffa.RestClient(server.hostname, server.port)
+        try:
+            field_cache = client.enable_field_cache(observe_interval=60.0)
+            observer = client._field_cache_observer
+            demo_object = client.document("testDocument").demoObject
+            assert demo_object.get_many(["intField", "stringField"])["intField"] == 1
+            assert observer.check() == 0
+
+            # The document field holding the object changes with it
+            server.objects[demo_object.uuid]["intField"] = 98
+            assert observer.check() == 2
+            assert field_cache.get(demo_object.uuid, "intField") is None
+            assert field_cache.get(demo_object.uuid, "stringField") == b'"Hello"'
+        finally:
+            client.quit()
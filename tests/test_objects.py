@@ -3,13 +3,157 @@ import json
 import logging
 import pytest
 
+from fakeserver import FakeCaffaServer
+
 log = logging.getLogger("test_objects")
 hostname = "127.0.0.1"
 
 
+def test_plain_object():
+    obj = caffa.Object({"keyword": "X", "uuid": "1"}, None, True)
+    assert obj.keyword == "X"
+    assert obj.get("uuid") == "1"
+    assert obj.to_dict() == {"keyword": "X", "uuid": "1"}
+    assert hasattr(obj, "__dict__")
+
+
+def demo_schema(method_name="copyValues"):
+    return {
+        "keyword": {"type": "string"},
+        "uuid": {"type": "string"},
+        "intField": {"type": "integer"},
+        "methods": {
+            "type": "object",
+            "properties": {
+                method_name: {"type": "object", "properties": {}},
+            },
+        },
+    }
+
+
+def test_class_reuse():
+    location = "/openapi.json/components/object_schemas/ReusedObject"
+    cls = caffa.create_class("ReusedObject", demo_schema(), location)
+    assert caffa.create_class("ReusedObject", demo_schema(), location) is cls
+
+    # Another schema at the same location, or the same schema at another
+    # location, gets a class of its own with its own method table
+    changed_cls = caffa.create_class("ReusedObject", demo_schema("reset"), location)
+    other_cls = caffa.create_class("ReusedObject", demo_schema(), location + "2")
+    assert changed_cls is not cls and other_cls is not cls
+    assert [method.static_name() for method in cls._methods] == ["copyValues"]
+    assert [method.static_name() for method in changed_cls._methods] == ["reset"]
+    assert other_cls._methods is not cls._methods
+    assert not hasattr(changed_cls, "copyValues")
+
+
+def test_method_binding():
+    location = "/openapi.json/components/object_schemas/BoundObject"
+    cls = caffa.create_class("BoundObject", demo_schema(), location)
+    assert cls.copyValues.static_name() == "copyValues"
+    assert issubclass(cls.copyValues, caffa.Method)
+
+    obj = cls({"keyword": "BoundObject", "uuid": "1"}, None, True)
+    other_obj = cls({"keyword": "BoundObject", "uuid": "2"}, None, True)
+    # Methods are bound on first use and then cached on the instance
+    assert "copyValues" not in vars(obj)
+    method = obj.copyValues
+    assert isinstance(method, cls.copyValues)
+    assert vars(obj)["copyValues"] is method
+    assert obj.copyValues is method
+    assert other_obj.copyValues is not method
+
+    methods = other_obj.methods()
+    assert [method.name() for method in methods] == ["copyValues"]
+    assert methods[0] is other_obj.copyValues
+
+
+def test_field_reads():
+    fields = ["intField", "doubleField", "stringField"]
+    expected = {"intField": 1, "doubleField": 1.0, "stringField": "Hello"}
+
+    with FakeCaffaServer() as server:
+        client = caffa.RestClient(server.hostname, server.port)
+        try:
+            demo_object = client.document("testDocument").demoObject
+            count = server.request_count
+            assert demo_object.get_many(fields) == expected
+            assert server.request_count - count == 1
+        finally:
+            client.quit()
+
+    # Without whole-object reads the fields are read one by one, and the client
+    # stops trying the whole-object read
+    with FakeCaffaServer(object_get=False) as server:
+        client = caffa.RestClient(server.hostname, server.port)
+        try:
+            demo_object = client.document("testDocument").demoObject
+            assert demo_object.get_many(fields) == expected
+            assert demo_object.to_dict()["stringField"] == "Hello"
+            count = server.request_count
+            assert demo_object.get_many(fields) == expected
+            assert server.request_count - count == len(fields)
+        finally:
+            client.quit()
+
+
+def test_field_writes():
+    with FakeCaffaServer(object_put=False) as server:
+        client = caffa.RestClient(server.hostname, server.port)
+        try:
+            demo_object = client.document("testDocument").demoObject
+            object_path = "/objects/" + demo_object.uuid
+            del server.requests[:]
+            with demo_object.batch():
+                demo_object.stringField = "First"
+                demo_object.intField = 7
+                demo_object.doubleField = 2.5
+                assert server.requests == []
+
+            # The whole-object write is rejected, and the fields are written in
+            # the order they were assigned
+            assert server.requests == [
+                ("PUT", object_path),
+                ("PUT", object_path + "/fields/stringField"),
+                ("PUT", object_path + "/fields/intField"),
+                ("PUT", object_path + "/fields/doubleField"),
+            ]
+            assert demo_object.get_many(["stringField", "intField", "doubleField"]) == {
+                "stringField": "First",
+                "intField": 7,
+                "doubleField": 2.5,
+            }
+
+            # Later batches go straight to the fields
+            del server.requests[:]
+            demo_object.set_fields(intField=8, stringField="Second")
+            assert server.requests == [
+                ("PUT", object_path + "/fields/intField"),
+                ("PUT", object_path + "/fields/stringField"),
+            ]
+
+            # Nothing is written if the block raises
+            del server.requests[:]
+            with pytest.raises(ValueError):
+                with demo_object.batch():
+                    demo_object.intField = 9
+                    raise ValueError("Abort")
+            assert server.requests == []
+            assert demo_object.intField == 8
+
+            # Per-field writes are not atomic: fields before a rejected one are kept
+            with pytest.raises(RuntimeError):
+                with demo_object.batch():
+                    demo_object.stringField = "Third"
+                    demo_object.enumField = "InvalidValue"
+            assert demo_object.stringField == "Third"
+        finally:
+            client.quit()
+
+
 class TestObjects(object):
     def setup_method(self, method):
-        self.testApp = caffa.RestClient(
+        self.testApp = caffa.RestClient.shared(
             hostname, 50000, username="test", password="password"
         )
 
@@ -24,6 +168,18 @@ class TestObjects(object):
         schema_location = self.testApp.schema_location_from_keyword(doc.keyword)
         print("With schema: " + json.dumps(self.testApp.schema(schema_location)))
 
+    def test_shared_classes(self):
+        doc = self.testApp.document("testDocument")
+        other_client = caffa.RestClient(
+            hostname, 50000, username="test", password="password"
+        )
+        try:
+            other_doc = other_client.document("testDocument")
+            assert type(other_doc) is type(doc)
+            assert type(other_doc.demoObject) is type(doc.demoObject)
+        finally:
+            other_client.quit()
+
     def test_fields(self):
         doc = self.testApp.document("testDocument")
         print(doc)
@@ -92,6 +248,129 @@ class TestObjects(object):
 
         assert values == [1, 2, 97]
 
+    def test_load_tree(self):
+        doc = self.testApp.load_tree("testDocument", max_concurrency=4)
+        assert doc is not None
+        assert doc.id == "testDocument"
+
+        demo_object = doc.demoObject
+        assert demo_object is not None
+        assert demo_object.to_dict()["keyword"] == demo_object.keyword
+
+    def test_compact_tree(self):
+        doc = self.testApp.load_tree("testDocument", compact=True)
+        assert isinstance(doc, caffa.CompactObject)
+        assert not hasattr(doc, "__dict__")
+        assert doc.id == "testDocument"
+
+        demo_object = doc.demoObject
+        assert isinstance(demo_object, caffa.CompactObject)
+        demo_object.intField = 43
+        assert demo_object.intField == 43
+        assert demo_object.to_dict()["intField"] == 43
+        assert doc.to_dict()["demoObject"]["uuid"] == demo_object.uuid
+
+    def test_tree_sync(self):
+        tree = caffa.TreeSync(self.testApp, "testDocument")
+        assert tree.root.id == "testDocument"
+        assert tree.pull() == set()
+
+        demo_object = tree.root.demoObject
+        demo_object.stringField = "Edited locally"
+        assert tree.push() == {demo_object.uuid: ["stringField"]}
+        remote_object = self.testApp.document("testDocument").demoObject
+        assert remote_object.stringField == "Edited locally"
+
+        remote_object.intField = 44
+        assert tree.pull() == {demo_object.uuid}
+        assert demo_object.intField == 44
+        assert demo_object.stringField == "Edited locally"
+
+    def test_tree_sync_etags(self):
+        with FakeCaffaServer(etags=True) as server:
+            client = caffa.RestClient(server.hostname, server.port)
+            request = client.session.request
+            statuses = []
+
+            def recording_request(method, url, **kwargs):
+                response = request(method, url, **kwargs)
+                statuses.append(response.status_code)
+                return response
+
+            client.session.request = recording_request
+            try:
+                tree = caffa.TreeSync(client, "testDocument")
+                object_count = len(tree._nodes)
+
+                # Unchanged objects are not transferred again
+                del statuses[:]
+                assert tree.pull() == set()
+                assert statuses == [304] * object_count
+
+                demo_object = tree.root.demoObject
+                server.objects[demo_object.uuid]["intField"] = 45
+                del statuses[:]
+                assert demo_object.uuid in tree.pull()
+                assert demo_object.intField == 45
+                assert statuses.count(200) >= 1
+            finally:
+                client.quit()
+
+    def test_execute_many(self):
+        doc = self.testApp.document("testDocument")
+        demo_object = doc.demoObject
+
+        future = demo_object.setIntVector.submit(intVector=[5, 6])
+        future.result()
+        assert demo_object.getIntVector() == [5, 6]
+
+        results = self.testApp.execute_many(
+            [
+                (demo_object, "getIntVector", None),
+                (demo_object, "doesNotExist", None),
+                (demo_object, demo_object.getIntVector, ()),
+            ],
+            return_exceptions=True,
+        )
+        assert results[0] == [5, 6]
+        assert isinstance(results[1], Exception)
+        assert results[2] == [5, 6]
+
+    def test_concurrent_method_calls(self):
+        with FakeCaffaServer(children_per_object=16) as server:
+            client = caffa.RestClient(server.hostname, server.port)
+            try:
+                objects = [
+                    client.object_class(child["keyword"], child)(child, client, False)
+                    for child in client.document("testDocument").children
+                ]
+                calls = []
+                for i, demo_object in enumerate(objects):
+                    if i % 2:
+                        arguments = {
+                            "intValue": i,
+                            "doubleValue": i / 2,
+                            "stringValue": "Value %d" % i,
+                        }
+                    else:
+                        arguments = (i, i / 2, "Value %d" % i)
+                    calls.append((demo_object, "copyValues", arguments))
+                client.execute_many(calls)
+
+                for i, json_object in enumerate(server.document["children"]):
+                    assert json_object["intField"] == i
+                    assert json_object["doubleField"] == i / 2
+                    assert json_object["stringField"] == "Value %d" % i
+            finally:
+                client.quit()
+
+    def test_too_many_method_arguments(self):
+        demo_object = self.testApp.document("testDocument").demoObject
+        with pytest.raises(TypeError, match="takes 1 positional arguments but 2"):
+            demo_object.setIntVector([1], [2], intVector=[3])
+        with pytest.raises(TypeError, match="takes 3 positional arguments but 4"):
+            demo_object.copyValues(1, 2.0, "3", 4)
+
     def test_non_existing_field(self):
         doc = self.testApp.document("testDocument")
         assert doc is not None
@@ -121,6 +400,29 @@ class TestObjects(object):
         demo_object.floatVector = [1.0, 3.0, -42.0]
         assert demo_object.floatVector == [1.0, 3.0, -42.0]
 
+    def test_numpy_float_vector(self):
+        numpy = pytest.importorskip("numpy")
+        client = caffa.RestClient(
+            hostname, 50000, username="test", password="password", numpy_arrays=True
+        )
+        try:
+            demo_object = client.document("testDocument").demoObject
+            demo_object.floatVector = numpy.array([1.0, 3.0, -42.0])
+            values = demo_object.floatVector
+            assert isinstance(values, numpy.ndarray)
+            assert values.tolist() == [1.0, 3.0, -42.0]
+        finally:
+            client.quit()
+
+    def test_iter_float_vector(self):
+        doc = self.testApp.document("testDocument")
+        assert doc is not None
+
+        demo_object = doc.get("demoObject")
+        demo_object.floatVector = [1.0, 3.0, -42.0, 7.0, 8.0]
+        batches = list(demo_object.iter_field("floatVector", chunk=2))
+        assert batches == [[1.0, 3.0], [-42.0, 7.0], [8.0]]
+
     def test_app_enum(self):
         doc = self.testApp.document("testDocument")
         assert doc is not None
@@ -0,0 +1,189 @@
+import caffa
+import pytest
+import requests
+
+from caffa import retry
+from caffa.retry import CircuitBreaker, CircuitOpenError, RetryPolicy
+from fakeserver import FakeCaffaServer
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(retry.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def server():
+    with FakeCaffaServer() as server:
+        yield server
+
+
+def connect(server, **kwargs):
+    kwargs.setdefault("retry_policy", RetryPolicy(max_attempts=3, backoff_factor=0))
+    kwargs.setdefault("circuit_breaker", CircuitBreaker())
+    return caffa.RestClient(server.hostname, server.port, **kwargs)
+
+
+def test_backoff_bounds(monkeypatch):
+    policy = RetryPolicy(backoff_factor=0.5, max_backoff=3.0)
+    monkeypatch.setattr(retry.random, "uniform", lambda low, high: (low, high))
+    assert [policy.backoff(attempt) for attempt in range(5)] == [
+        (0.0, 0.5),
+        (0.0, 1.0),
+        (0.0, 2.0),
+        (0.0, 3.0),
+        (0.0, 3.0),
+    ]
+
+
+def test_backoff_full_jitter():
+    policy = RetryPolicy(backoff_factor=1.0, max_backoff=4.0)
+    for attempt in range(4):
+        limit = min(4.0, 2**attempt)
+        delays = [policy.backoff(attempt) for _ in range(200)]
+        assert all(0.0 <= delay <= limit for delay in delays)
+        # Delays are spread over the whole range, not clustered at the limit
+        assert min(delays) < limit / 4 and max(delays) > limit * 3 / 4
+
+
+def test_should_retry():
+    policy = RetryPolicy(max_attempts=3)
+    for method in ("GET", "HEAD", "OPTIONS", "PUT", "DELETE"):
+        assert policy.should_retry(method, 0)
+        assert policy.should_retry(method, 1)
+        assert not policy.should_retry(method, 2)
+    assert not policy.should_retry("POST", 0)
+    assert not retry.NO_RETRIES.should_retry("GET", 0)
+
+
+def test_circuit_breaker_transitions(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10.0)
+    breaker.before_request()
+    breaker.record_failure()
+    assert not breaker.is_open
+
+    # Closed -> open after failure_threshold consecutive failures
+    breaker.record_failure()
+    assert breaker.is_open
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+    clock.now += 9.0
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+    # Open -> half-open after reset_timeout, letting a single trial through
+    clock.now += 1.0
+    breaker.before_request()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+    # A failed trial opens the circuit again for another reset_timeout
+    breaker.record_failure()
+    assert breaker.is_open
+    clock.now += 5.0
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+    # Half-open -> closed when the trial succeeds
+    clock.now += 5.0
+    breaker.before_request()
+    breaker.record_success()
+    assert not breaker.is_open
+    breaker.before_request()
+    breaker.before_request()
+
+
+def test_retry_statuses(server):
+    client = connect(server)
+    try:
+        server.fail_statuses += [503, 429]
+        count = server.request_count
+        assert client.app_info().name == "Fake Caffa Server"
+        assert server.request_count - count == 3
+
+        # Other errors are not retried
+        server.fail_statuses.append(500)
+        count = server.request_count
+        with pytest.raises(RuntimeError):
+            client.app_info()
+        assert server.request_count - count == 1
+
+        # The last error is raised when all attempts have failed
+        server.fail_statuses += [502, 503, 504]
+        count = server.request_count
+        with pytest.raises(RuntimeError, match="Injected failure"):
+            client.app_info()
+        assert server.request_count - count == 3
+    finally:
+        client.quit()
+
+
+def test_post_is_not_retried(server):
+    client = connect(server)
+    try:
+        demo_object = client.document("testDocument").demoObject
+        server.fail_statuses.append(503)
+        count = server.request_count
+        with pytest.raises(requests.exceptions.HTTPError):
+            demo_object.getIntVector()
+        assert server.request_count - count == 1
+    finally:
+        client.quit()
+
+
+def test_retry_exceptions(server, monkeypatch):
+    client = connect(server)
+    request = client.session.request
+    errors = []
+    calls = []
+
+    def failing_request(method, url, **kwargs):
+        calls.append(method)
+        if errors:
+            raise errors.pop(0)
+        return request(method, url, **kwargs)
+
+    monkeypatch.setattr(client.session, "request", failing_request)
+    try:
+        errors += [requests.exceptions.ConnectionError(), requests.exceptions.Timeout()]
+        assert client.app_info().name == "Fake Caffa Server"
+        assert len(calls) == 3
+
+        # Errors that are not about reaching the server are not retried
+        errors.append(requests.exceptions.InvalidHeader())
+        del calls[:]
+        with pytest.raises(RuntimeError):
+            client.app_info()
+        assert len(calls) == 1
+    finally:
+        client.quit()
+
+
+def test_circuit_open_error(server):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60.0)
+    client = connect(server, retry_policy=retry.NO_RETRIES, circuit_breaker=breaker)
+    try:
+        server.fail_statuses.append(503)
+        with pytest.raises(RuntimeError, match="Injected failure"):
+            client.app_info()
+        assert breaker.is_open
+
+        count = server.request_count
+        with pytest.raises(CircuitOpenError):
+            client._send_request("GET", "/app/info")
+        with pytest.raises(CircuitOpenError):
+            client.app_info()
+        assert server.request_count == count
+    finally:
+        breaker.record_success()
+        client.quit()
@@ -0,0 +1,285 @@
+###################################################################################################
+#
+#   Caffa
+#   Copyright (C) Kontur AS
+#
+#   GNU Lesser General Public License Usage
+#   This library is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation; either version 2.1 of the License, or
+#   (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful, but WITHOUT ANY
+#   WARRANTY; without even the implied warranty of MERCHANTABILITY or
+#   FITNESS FOR A PARTICULAR PURPOSE.
+#
+#   See the GNU Lesser General Public License at <<http:#www.gnu.org/licenses/lgpl-2.1.html>>
+#   for more details.
+#
+import io
+import socket
+
+import requests
+import urllib3
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+# Transports carry the HTTP requests of a RestClient to the server. A transport
+# provides the base URL of the server, an endpoint string identifying the server for
+# per-server state such as circuit breakers and cached responses, and mounts a
+# requests adapter for it on the client session:
+#
+# TcpTransport: HTTP/1.1 over TCP (the default).
+# UnixSocketTransport: HTTP/1.1 over a Unix domain socket, for clients on the same
+# host as the server. Avoids the TCP stack and port allocation.
+# Http2Transport: HTTP/2 through httpx, multiplexing concurrent requests over a
+# single connection. Needs httpx with HTTP/2 support (pip install httpx[http2]).
+
+
+class TcpTransport:
+    def __init__(self, hostname, port):
+        self.hostname = hostname
+        self.port = port
+
+    def base_url(self):
+        return "http://" + self.hostname + ":" + str(self.port)
+
+    def endpoint(self):
+        return self.base_url()
+
+    def mount(self, session, pool_connections, pool_maxsize, pool_block):
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+
+class UnixSocketTransport:
+    # The host name only appears in the Host header
+    hostname = "localhost"
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+
+    def base_url(self):
+        return "http://" + self.hostname
+
+    def endpoint(self):
+        return "unix:" + self.socket_path
+
+    def mount(self, session, pool_connections, pool_maxsize, pool_block):
+        session.mount(
+            self.base_url(),
+            _UnixSocketAdapter(self.socket_path, pool_maxsize, pool_block),
+        )
+
+
+class _UnixSocketConnection(urllib3.connection.HTTPConnection):
+    def __init__(self, *args, socket_path=None, **kwargs):
+        self.socket_path = socket_path
+        super().__init__(*args, **kwargs)
+
+    def _new_conn(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if isinstance(self.timeout, (int, float)):
+            sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except socket.timeout as e:
+            sock.close()
+            raise urllib3.exceptions.ConnectTimeoutError(
+                self, "Connection to %s timed out" % self.socket_path
+            ) from e
+        except OSError as e:
+            sock.close()
+            raise urllib3.exceptions.NewConnectionError(
+                self, "Failed to connect to %s: %s" % (self.socket_path, e)
+            ) from e
+        return sock
+
+
+class _UnixSocketConnectionPool(urllib3.HTTPConnectionPool):
+    ConnectionCls = _UnixSocketConnection
+
+
+class _UnixSocketAdapter(requests.adapters.HTTPAdapter):
+    def __init__(self, socket_path, pool_maxsize, pool_block):
+        super().__init__(pool_maxsize=pool_maxsize, pool_block=pool_block)
+        self._connection_pool = _UnixSocketConnectionPool(
+            UnixSocketTransport.hostname,
+            maxsize=pool_maxsize,
+            block=pool_block,
+            socket_path=socket_path,
+        )
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        return self._connection_pool
+
+    # For requests versions before 2.32
+    def get_connection(self, url, proxies=None):
+        return self._connection_pool
+
+    def close(self):
+        self._connection_pool.close()
+        super().close()
+
+
+class Http2Transport:
+    # Without TLS the server must accept HTTP/2 with prior knowledge (h2c).
+    # With TLS the protocol is negotiated, falling back to HTTP/1.1.
+    # httpx_transport replaces the network connections of the httpx client, for
+    # instance with an httpx.MockTransport in tests.
+    def __init__(self, hostname, port, tls=False, verify=True, httpx_transport=None):
+        try:
+            import h2  # noqa: F401
+            import httpx
+        except ImportError:
+            raise ImportError(
+                "HTTP/2 needs httpx with HTTP/2 support (pip install httpx[http2])"
+            ) from None
+        self._httpx = httpx
+        self.hostname = hostname
+        self.port = port
+        self.tls = tls
+        self.verify = verify
+        self.httpx_transport = httpx_transport
+
+    def base_url(self):
+        scheme = "https://" if self.tls else "http://"
+        return scheme + self.hostname + ":" + str(self.port)
+
+    def endpoint(self):
+        return self.base_url()
+
+    def mount(self, session, pool_connections, pool_maxsize, pool_block):
+        client = self._httpx.Client(
+            http1=self.tls,
+            http2=True,
+            verify=self.verify,
+            limits=self._httpx.Limits(max_connections=pool_maxsize),
+            transport=self.httpx_transport,
+        )
+        session.mount(self.base_url(), _HttpxAdapter(self._httpx, client))
+
+
+# Connection specific headers, which are not allowed in HTTP/2
+_HOP_BY_HOP_HEADERS = frozenset(
+    ["connection", "keep-alive", "proxy-connection", "transfer-encoding", "upgrade"]
+)
+
+
+# Sends requests prepared by a requests session through an httpx client, and
+# converts the responses and errors back, so the rest of the client is unaware.
+class _HttpxAdapter(requests.adapters.BaseAdapter):
+    def __init__(self, httpx, client):
+        super().__init__()
+        self._httpx = httpx
+        self._client = client
+
+    def send(
+            self,
+            request,
+            stream=False,
+            timeout=None,
+            verify=True,
+            cert=None,
+            proxies=None,
+    ):
+        httpx = self._httpx
+        headers = [
+            (name, value)
+            for name, value in request.headers.items()
+            if name.lower() not in _HOP_BY_HOP_HEADERS
+        ]
+        try:
+            response = self._client.send(
+                self._client.build_request(
+                    request.method,
+                    request.url,
+                    headers=headers,
+                    content=request.body,
+                    timeout=_httpx_timeout(httpx, timeout),
+                ),
+                stream=True,
+            )
+        except httpx.ConnectTimeout as e:
+            raise requests.exceptions.ConnectTimeout(e, request=request) from e
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.ReadTimeout(e, request=request) from e
+        except httpx.TransportError as e:
+            raise requests.exceptions.ConnectionError(e, request=request) from e
+
+        result = requests.Response()
+        result.status_code = response.status_code
+        result.reason = response.reason_phrase
+        result.headers = CaseInsensitiveDict()
+        for name, value in response.headers.multi_items():
+            if name in result.headers:
+                value = result.headers[name] + ", " + value
+            result.headers[name] = value
+        result.encoding = get_encoding_from_headers(result.headers)
+        result.url = request.url
+        result.request = request
+        result.connection = self
+        # httpx has already decoded any Content-Encoding
+        result.raw = _HttpxBody(response)
+        if not stream:
+            try:
+                result._content = response.read()
+            finally:
+                response.close()
+        return result
+
+    def close(self):
+        self._client.close()
+
+
+# The body of a streamed httpx response, in place of the urllib3 response body
+class _HttpxBody(io.RawIOBase):
+    def __init__(self, response):
+        super().__init__()
+        self._response = response
+        self._chunks = response.iter_bytes()
+        self._buffer = b""
+
+    def read(self, size=-1, **kwargs):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def readinto(self, buffer):
+        while not self._buffer:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._buffer = chunk
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+    def readable(self):
+        return True
+
+    def close(self):
+        self._response.close()
+        super().close()
+
+    def release_conn(self):
+        self._response.close()
+
+
+def _httpx_timeout(httpx, timeout):
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return httpx.Timeout(read, connect=connect)
+    return httpx.Timeout(timeout)